@@ -1,18 +1,172 @@
 #!/usr/bin/python3
 
 import argparse
+import concurrent.futures
+import io
+import math
+import os
 import re
+import signal
+import struct
 import subprocess
 import sys
+import threading
 import time
 
 NUM_TESTS = 10
+# how many runs of the scenarios run at a time, per CPU, with --repeat
+REPEAT_JOBS_PER_CPU = 32
 
-KILL_RE = re.compile(r'^\s*(\d+)\.\d+\s+kill\(\d+, (SIG[A-Z0-9]+|\d+)\)')
+KILL_RE = re.compile(r'^\s*(\d+\.\d+)\s+kill\(\d+, (SIG[A-Z0-9]+|\d+)\)')
 RULE_NOSIG_RE = re.compile(r'^NOSIG:\s*(.+)')
 RULE_SIGTIMING_RE = re.compile(r'^SIGTIMING:\s*(.+)')
 RULE_SIGTIMING_PAIR_RE = re.compile(r'^([A-Z0-9_]+)([=<>])(.+)')
 
+# A tracer runs a scenario and returns its output, along with the signals sent
+# with kill() by the process running signals (and then killer), but not by its
+# children, as (seconds, signal) events.  As with "strace -r", seconds is the
+# time since the previous event, and signal is the name of the signal (e.g.,
+# "SIGHUP"), or its number, if it has none.  Each scenario runs in a process
+# group of its own, so that killer sending SIGKILL to its group (see killer.c)
+# touches neither the driver nor the other scenarios running at the same time.
+
+# Runs the scenario under strace, and parses its output.
+class StraceTracer:
+    def run(self, cmd):
+        cmd = ['strace', '-r', '-e', 'trace=%signal'] + cmd
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                start_new_session=True)
+        events = []
+        for line in p.stderr.decode('utf-8').strip().splitlines():
+            m = KILL_RE.search(line)
+            if m is not None:
+                events.append((float(m.group(1)), m.group(2)))
+        return p.stdout, events
+
+# Runs the scenario with killtrace.so preloaded, which records each call to
+# kill() (see killtrace.c), much more cheaply than strace does, so that the
+# timing of the signals is hardly disturbed.  Times are relative to the
+# previous call to kill(), or to the start of killer.
+class PreloadTracer:
+    LIBRARY = './killtrace.so'
+    # struct killtrace_event: time_ns, type, caller, pid, sig
+    EVENT = struct.Struct('=Qiiii')
+    EVENT_START = 0
+    EVENT_KILL = 1
+    # how long to wait for the rest of the events once the process has exited
+    DRAIN_TIMEOUT = 1
+
+    def _read_events(self, fh, data):
+        while True:
+            buf = fh.read(self.EVENT.size)
+            if len(buf) < self.EVENT.size:
+                break
+            data.append(self.EVENT.unpack(buf))
+        fh.close()
+
+    def _signal_name(self, sig):
+        try:
+            return signal.Signals(sig).name
+        except ValueError:
+            return str(sig)
+
+    def run(self, cmd):
+        r, w = os.pipe()
+        env = dict(os.environ, LD_PRELOAD=os.path.abspath(self.LIBRARY),
+                KILLTRACE_FD=str(w))
+        data = []
+        # the events are read as they come, so that the pipe never fills up
+        t = threading.Thread(target=self._read_events,
+                args=(os.fdopen(r, 'rb'), data), daemon=True)
+        t.start()
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL, env=env, pass_fds=(w,),
+                    start_new_session=True)
+        finally:
+            os.close(w)
+        stdout, stderr = p.communicate()
+        # any children still running have the pipe open too
+        t.join(self.DRAIN_TIMEOUT)
+
+        events = []
+        last_time = None
+        for (time_ns, event_type, caller, pid, sig) in list(data):
+            if caller != p.pid:
+                continue
+            if last_time is not None and event_type == self.EVENT_KILL:
+                events.append(((time_ns - last_time) / 1e9,
+                    self._signal_name(sig)))
+            last_time = time_ns
+        return stdout, events
+
+TRACERS = {
+        'strace': StraceTracer,
+        'preload': PreloadTracer,
+        }
+
+def _nosig(sig):
+    return lambda t: f'{sig} not allowed'
+
+def _precision(timing):
+    # the unit of the last digit of timing, as written (e.g., 1 for "3", 0.1
+    # for "0.5")
+    if '.' not in timing:
+        return 1
+    return 10 ** -len(timing.split('.', 1)[1])
+
+def _before(sig, timing):
+    return lambda t: None if t < timing else \
+            f'{sig} can only be sent before {timing:g} seconds have passed'
+
+def _after(sig, timing):
+    return lambda t: None if t >= timing else \
+            f'{sig} can only be sent after {timing:g} seconds have passed'
+
+def _exactly(sig, timing, precision=1):
+    # The time, truncated to the precision of timing, must be timing: within
+    # the second that starts at timing for "=3", or within the tenth of a
+    # second that starts at it for "=0.5".
+    return lambda t: None if timing <= t < timing + precision else \
+            f'{sig} can only be sent when exactly {timing:g} seconds have passed'
+
+TIMING_CHECKS = {
+        '<': _before,
+        '>': _after,
+        '=': _exactly,
+        }
+
+def compile_rules(rules):
+    # Compile rules into a table that maps each signal to the checks for it:
+    # functions that take the time of an event for the signal, and return
+    # what is wrong with it, or None.  Times in SIGTIMING rules may be
+    # fractions of a second.
+    table = {}
+    for rule in rules:
+        # Disallowed signals
+        m = RULE_NOSIG_RE.search(rule)
+        if m is not None:
+            for sig in m.group(1).split(','):
+                sig = sig.strip()
+                table.setdefault(sig, []).append(_nosig(sig))
+            continue
+        # Signals with timing requirements
+        m = RULE_SIGTIMING_RE.search(rule)
+        if m is not None:
+            for pair in m.group(1).split(','):
+                m = RULE_SIGTIMING_PAIR_RE.match(pair.strip())
+                if m is None:
+                    continue
+                sig = m.group(1).strip()
+                op = m.group(2)
+                timing = m.group(3).strip()
+                if op == '=':
+                    check = _exactly(sig, float(timing), _precision(timing))
+                else:
+                    check = TIMING_CHECKS[op](sig, float(timing))
+                table.setdefault(sig, []).append(check)
+    return table
+
 class KillTest:
     signals = './signals'
     killer = './killer'
@@ -22,106 +176,78 @@ class KillTest:
     max_time = None
     rules = ['NOSIG: SIGKILL,9']
 
+    def __init__(self, tracer=None):
+        if tracer is None:
+            tracer = StraceTracer()
+        self.tracer = tracer
+        # What grade() has to say, kept here rather than printed, so that
+        # scenarios graded at the same time don't mix their output.
+        self.output = io.StringIO()
+        # set by grade(): the time it took, the signals sent, and a short
+        # description of each way in which the scenario failed
+        self.elapsed = None
+        self.events = None
+        self.failures = []
+
+    def report(self, msg):
+        self.output.write(msg + '\n')
+
     def grade(self):
-        cmd = ['strace', '-r', '-e', 'trace=%signal',
-                self.signals, self.killer, str(self.scenario)]
+        cmd = [self.signals, self.killer, str(self.scenario)]
 
-        start_time = time.time()
-        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        end_time = time.time()
+        start_time = time.monotonic()
+        stdout, events = self.tracer.run(cmd)
+        end_time = time.monotonic()
+        self.elapsed = end_time - start_time
+        self.events = events
 
+        # Every check is made, whatever the others find, so that all the ways
+        # in which the scenario failed are reported.
         if self.solution is not None:
             expected = self.stringify_solution()
-            actual = p.stdout.decode('utf-8').strip()
+            actual = stdout.decode('utf-8').strip()
             if expected != actual:
-                print(f'\nExpected:\n{expected}\n\nGot:\n{actual}\n')
-                return False
+                self.report(f'\nExpected:\n{expected}\n\nGot:\n{actual}\n')
+                self.failures.append('output: ' + \
+                        (','.join(actual.split()) or '(none)'))
 
         # Check timing
         if self.max_time is not None:
             time_elapsed = int(end_time - start_time)
             if time_elapsed > self.max_time:
-                print(f'\nTime elapsed: {time_elapsed}s\n' + \
+                self.report(f'\nTime elapsed: {time_elapsed}s\n' + \
                         f'Maximum allowed: {self.max_time}s\n')
-                return False
+                self.failures.append(f'took more than {self.max_time}s')
 
         # Apply rules
-        output = p.stderr.decode('utf-8').strip()
-        if not self.apply_rules(output.splitlines()):
-            return False
+        self.apply_rules(events)
 
-        return True
+        return not self.failures
 
     def stringify_solution(self):
         return '\n'.join([str(i) for i in self.solution])
 
-    def apply_rules(self, strace_lines):
-        for rule in self.rules:
-            # Disallowed signals
-            m = RULE_NOSIG_RE.search(rule)
-            if m is not None:
-                if not self.apply_nosig(m.group(1), strace_lines):
-                    return False
-                continue
-            # Signals with timing requirements
-            m = RULE_SIGTIMING_RE.search(rule)
-            if m is not None:
-                if not self.apply_sig_timing(m.group(1), strace_lines):
-                    return False
-                continue
-        return True
+    @classmethod
+    def compiled_rules(cls):
+        # the rules of the class, compiled the first time they are needed
+        if '_compiled_rules' not in cls.__dict__:
+            cls._compiled_rules = compile_rules(cls.rules)
+        return cls._compiled_rules
 
-    def apply_nosig(self, sigs_str, strace_lines):
-        sigs_set = set([s.strip() for s in sigs_str.split(',')])
-        for line in strace_lines:
-            m = KILL_RE.search(line)
-            if m is None:
-                continue
-            sig_used = m.group(2)
-            if sig_used in sigs_set:
-                print(f'\n{sig_used} not allowed\n')
-                return False
-        return True
-
-    def apply_sig_timing(self, sig_timing, strace_lines):
-        sig_mapping = {}
-        pairs = sig_timing.split(',')
-        for pair in pairs:
-            m = RULE_SIGTIMING_PAIR_RE.match(pair)
-            if m is None:
-                continue
-            sig = m.group(1).strip()
-            op = m.group(2)
-            timing = m.group(3).strip()
-            sig = sig.strip()
-            timing = int(timing.strip())
-            sig_mapping[sig] = op, timing
-
-        for line in strace_lines:
-            m = KILL_RE.search(line)
-            if m is None:
-                continue
-            time_used = int(m.group(1))
-            sig_used = m.group(2)
-            if sig_used not in sig_mapping:
-                continue
-            op, timing = sig_mapping[sig_used]
-            if op == '<':
-                if time_used >= timing:
-                    print(f'\n{sig_used} can only be sent before {timing} ' + \
-                            'seconds have passed\n')
-                    return False
-            elif op == '>':
-                if time_used < timing:
-                    print(f'\n{sig_used} can only be sent after {timing} ' + \
-                            'seconds have passed\n')
-                    return False
-            elif op in ('=', None):
-                if time_used != timing:
-                    print(f'\n{sig_used} can only be sent when exactly ' + \
-                            '{timing} seconds have passed\n')
-                    return False
-        return True
+    def apply_rules(self, events):
+        # Check every event against the rules for its signal, in one pass,
+        # and report every rule broken, not just the first.
+        table = self.compiled_rules()
+        violations = []
+        for (time_used, sig_used) in events:
+            for check in table.get(sig_used, []):
+                msg = check(time_used)
+                if msg is not None and msg not in violations:
+                    violations.append(msg)
+        for msg in violations:
+            self.report(f'\n{msg}\n')
+        self.failures.extend(violations)
+        return not violations
 
 
 class KillTest0(KillTest):
@@ -169,42 +295,150 @@ class KillTest9(KillTest):
     rules = KillTest.rules + \
             ['NOSIG: SIGHUP,SIGINT,1,2']
     
+def grade(scenario, tracer):
+    cls = getattr(sys.modules[__name__], f'KillTest{scenario}', None)
+    test = cls(tracer)
+    return test.grade(), test
+
+def percentile(sorted_values, p):
+    # nearest-rank percentile of a sorted list
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+def distribution(values):
+    values = sorted(values)
+    return f'p50 {percentile(values, 50):.3f}s, ' + \
+            f'p90 {percentile(values, 90):.3f}s, ' + \
+            f'p99 {percentile(values, 99):.3f}s, max {values[-1]:.3f}s'
+
+def start_load(num):
+    # processes that keep a CPU busy each, so that timing-dependent failures
+    # show up
+    return [subprocess.Popen([sys.executable, '-c', 'while True: pass'])
+            for i in range(num)]
+
+def stop_load(procs):
+    for p in procs:
+        p.kill()
+    for p in procs:
+        p.wait()
+
+def summarize(scenario, results):
+    # results: (passed, test) for every run of the scenario
+    passes = len([passed for (passed, test) in results if passed])
+    runs = len(results)
+    if passes == runs:
+        verdict = 'PASSED'
+    elif passes == 0:
+        verdict = 'FAILED'
+    else:
+        verdict = 'FLAKY'
+    print(f'Scenario {scenario}: {passes}/{runs} passed ' + \
+            f'({100 * passes / runs:.1f}%)   {verdict}')
+    print(f'    time: {distribution([test.elapsed for (passed, test) in results])}')
+
+    # the time of each kill(), by its position among them and its signal
+    times = {}
+    for (passed, test) in results:
+        for (i, (t, sig)) in enumerate(test.events):
+            times.setdefault((i, sig), []).append(t)
+    for (i, sig) in sorted(times):
+        print(f'    kill() #{i + 1} ({sig}, {len(times[(i, sig)])} runs): ' + \
+                distribution(times[(i, sig)]))
+
+    # how the failed runs failed, most common first
+    signatures = {}
+    for (passed, test) in results:
+        if not passed:
+            signature = '; '.join(test.failures)
+            signatures[signature] = signatures.get(signature, 0) + 1
+    for (signature, count) in sorted(signatures.items(),
+            key=lambda item: -item[1]):
+        print(f'    {count}x {signature}')
+    return verdict
+
+def run_repeated(scenarios, tracer, repeat, load, jobs):
+    # Run every scenario repeat times, up to jobs runs at a time, while load
+    # CPU hogs run, and report how often each passed, how long its kill()
+    # calls took, and how it failed.
+    procs = start_load(load)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            futures = dict([(scenario,
+                [executor.submit(grade, scenario, tracer)
+                    for i in range(repeat)])
+                for scenario in scenarios])
+            verdicts = [summarize(scenario,
+                [f.result() for f in futures[scenario]])
+                for scenario in scenarios]
+    finally:
+        stop_load(procs)
+    flaky = [str(scenario) for (scenario, verdict) in zip(scenarios, verdicts)
+            if verdict == 'FLAKY']
+    print(f'Flaky scenarios: {", ".join(flaky) or "none"}')
+
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--jobs', type=int, action='store',
+            metavar='<num>',
+            help=f'Run up to <num> scenarios at the same time (default: {NUM_TESTS}, or {REPEAT_JOBS_PER_CPU} per CPU with -r).')
+    parser.add_argument('-t', '--tracer', type=str, action='store',
+            default='strace', choices=TRACERS.keys(),
+            help='Trace the signals sent with strace, or with killtrace.so ("make killtrace.so"), which is much lighter (default: strace).')
+    parser.add_argument('-r', '--repeat', type=int, action='store',
+            metavar='<num>',
+            help='Run each scenario <num> times, and report how often it passed, the timing of its kill() calls, and how it failed.')
+    parser.add_argument('-l', '--load', type=int, action='store',
+            default=0, metavar='<num>',
+            help='With -r, keep <num> CPUs busy with other processes while the scenarios run (default: 0).')
     parser.add_argument('scenario', action='store',
             nargs='?', type=int, choices=range(NUM_TESTS))
     args = parser.parse_args(sys.argv[1:])
-    
-    thismodule = sys.modules[__name__]
+    if args.jobs is None:
+        if args.repeat is None:
+            args.jobs = NUM_TESTS
+        else:
+            # the scenarios mostly sleep, so many more of them than there
+            # are CPUs can run at once
+            args.jobs = REPEAT_JOBS_PER_CPU * (os.cpu_count() or 1)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.repeat is not None and args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    if args.load < 0 or (args.load and args.repeat is None):
+        parser.error('--load needs --repeat, and cannot be negative')
+
     if args.scenario is None:
-        score = 0
-        max_score = 0
-        for scenario in range(NUM_TESTS):
+        scenarios = list(range(NUM_TESTS))
+    else:
+        scenarios = [args.scenario]
+
+    tracer = TRACERS[args.tracer]()
+    if args.repeat is not None:
+        run_repeated(scenarios, tracer, args.repeat, args.load, args.jobs)
+        return
+
+    # Every scenario runs in its own processes and mostly sleeps, so they
+    # are all started at once, each timed on its own, and their results are
+    # printed in order, as soon as those before them are done.
+    score = 0
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        futures = [executor.submit(grade, scenario, tracer)
+                for scenario in scenarios]
+        for scenario, future in zip(scenarios, futures):
             sys.stdout.write(f'Testing scenario {scenario}:')
             sys.stdout.flush()
-            max_score += 1
-            cls = getattr(thismodule, f'KillTest{scenario}', None)
-            test = cls()
-            if test.grade():
+            passed, test = future.result()
+            sys.stdout.write(test.output.getvalue())
+            if passed:
                 sys.stdout.write('   PASSED\n')
                 sys.stdout.flush()
                 score += 1
             else:
                 sys.stdout.write('   FAILED\n')
                 sys.stdout.flush()
-        print(f'Score: {score}/{max_score}')
-    else:
-        scenario = args.scenario
-        sys.stdout.write(f'Testing scenario {scenario}:')
-        sys.stdout.flush()
-        cls = getattr(thismodule, f'KillTest{scenario}', None)
-        test = cls()
-        if test.grade():
-            sys.stdout.write('   PASSED\n')
-            sys.stdout.flush()
-        else:
-            sys.stdout.write('   FAILED\n')
-            sys.stdout.flush()
+    if args.scenario is None:
+        print(f'Score: {score}/{len(scenarios)}')
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,128 @@
+/*
+ * killtrace.c - A library that records the calls to kill() of a program, for
+ * driver.py, which loads it with LD_PRELOAD, rather than running the program
+ * under strace.
+ *
+ * Every call to kill() is written, as a struct killtrace_event, to the file
+ * descriptor named by the KILLTRACE_FD environment variable (a pipe), before
+ * the signal is sent.  An event is also written when the library is loaded,
+ * i.e., when the program starts, so that the time of each call can be told
+ * relative to it.  Times are those of CLOCK_MONOTONIC.  Programs that the
+ * program executes are traced too, even if it gives them an empty
+ * environment, as signals does for killer.
+ *
+ * Only calls to kill() itself are seen: signals sent with the kill system
+ * call directly, or with other functions, such as killpg(), are not.
+ */
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <signal.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+
+#define KILLTRACE_START 0
+#define KILLTRACE_KILL 1
+
+/* must match EVENT in driver.py */
+struct killtrace_event {
+	uint64_t time_ns;
+	int32_t type;
+	int32_t caller;
+	int32_t pid;
+	int32_t sig;
+};
+
+static int trace_fd = -1;
+static char *preload_env = NULL;
+static char *fd_env = NULL;
+static int (*real_kill)(pid_t, int) = NULL;
+static int (*real_execve)(const char *, char *const [], char *const []) = NULL;
+
+/* async-signal-safe, so that kill() can be called from a handler */
+static void record(int type, pid_t pid, int sig) {
+	struct killtrace_event ev;
+	struct timespec ts;
+	int saved_errno = errno;
+
+	if (trace_fd < 0) {
+		return;
+	}
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	ev.time_ns = (uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+	ev.type = type;
+	ev.caller = getpid();
+	ev.pid = pid;
+	ev.sig = sig;
+	/* a write this small to a pipe is atomic */
+	write(trace_fd, &ev, sizeof(ev));
+	errno = saved_errno;
+}
+
+static char *copy_env(const char *name) {
+	char *value = getenv(name);
+	char *s;
+
+	if (value == NULL) {
+		return NULL;
+	}
+	s = malloc(strlen(name) + strlen(value) + 2);
+	if (s != NULL) {
+		sprintf(s, "%s=%s", name, value);
+	}
+	return s;
+}
+
+__attribute__((constructor))
+static void killtrace_init(void) {
+	char *s = getenv("KILLTRACE_FD");
+
+	real_kill = dlsym(RTLD_NEXT, "kill");
+	real_execve = dlsym(RTLD_NEXT, "execve");
+	if (s == NULL) {
+		return;
+	}
+	trace_fd = atoi(s);
+	preload_env = copy_env("LD_PRELOAD");
+	fd_env = copy_env("KILLTRACE_FD");
+	record(KILLTRACE_START, 0, 0);
+}
+
+int kill(pid_t pid, int sig) {
+	record(KILLTRACE_KILL, pid, sig);
+	return real_kill(pid, sig);
+}
+
+int execve(const char *path, char *const argv[], char *const envp[]) {
+	char **env;
+	int n = 0, i = 0, ret;
+
+	if (preload_env == NULL || fd_env == NULL) {
+		return real_execve(path, argv, envp);
+	}
+
+	/* pass LD_PRELOAD and KILLTRACE_FD on, whatever the environment */
+	while (envp[n] != NULL) {
+		n++;
+	}
+	env = malloc(sizeof(char *) * (n + 3));
+	if (env == NULL) {
+		return real_execve(path, argv, envp);
+	}
+	for (n = 0; envp[n] != NULL; n++) {
+		if (strncmp(envp[n], "LD_PRELOAD=", 11) != 0 &&
+				strncmp(envp[n], "KILLTRACE_FD=", 13) != 0) {
+			env[i++] = envp[n];
+		}
+	}
+	env[i++] = preload_env;
+	env[i++] = fd_env;
+	env[i] = NULL;
+	ret = real_execve(path, argv, env);
+	free(env);
+	return ret;
+}
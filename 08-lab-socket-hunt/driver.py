@@ -1,8 +1,8 @@
 #!/usr/bin/python3
 
 import argparse
+import concurrent.futures
 import hashlib
-import random
 import re
 import socket
 import subprocess
@@ -16,6 +16,10 @@ SEEDS = [7719, 33833, 20468, 19789, 59455]
 CLIENT = './treasure_hunter'
 BYTES_MINUS_CHUNK = 8
 TIMEOUT = 20
+# how many level/seed combinations are tested at a time, and how many of
+# those may be talking to the server at a time, by default
+JOBS = 8
+MAX_IN_FLIGHT = 4
 
 LEVEL_SCORES = { 0: 50, 1: 15, 2: 15, 3: 15, 4: 5 }
 LEVELS_EXTRA_CREDIT = [ 4 ]
@@ -39,35 +43,39 @@ SUMS = ['3e7949f4943f1d40959c87166a46e0433665fb19',
 
 RECV_RE = re.compile('^recv(from)?.* = (\d+)$')
 
-level_seed_result = (False, 0, None, None)
-
-def tmp_server(port):
-    global level_seed_result
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s.settimeout(1)
-    s.bind(('127.0.0.1', port))
+# a semaphore for each (server, port), which limits how many clients talk to
+# it at a time
+server_slots = {}
+server_slots_lock = threading.Lock()
 
+def tmp_server(s, result):
     try:
         (buf, addr) = s.recvfrom(65536)
     except socket.timeout:
         return
     if len(buf) != 8:
-        level_seed_result = (True, len(buf), None, None)
+        result[:] = [True, len(buf), None, None]
         return
     level, userid, seed = struct.unpack('!HIH', buf[:8])
-    level_seed_result = (True, len(buf), level, seed)
+    result[:] = [True, len(buf), level, seed]
 
 def test_level_seed(level, seed):
-    global level_seed_result
-    port = random.randint(1024, 65535)
-    level_seed_result = (None, None)
-    t = threading.Thread(target=tmp_server, args=(port,))
+    # Each test has its own socket, on a port chosen by the system, and its
+    # own result, so that several can run at once.
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(1)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    level_seed_result = [False, 0, None, None]
+    t = threading.Thread(target=tmp_server, args=(s, level_seed_result))
     t.start()
     cmd = [CLIENT, '127.0.0.1', str(port), str(level), str(seed)]
     p = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL)
     t.join()
     p.kill()
+    p.wait()
+    s.close()
     if not level_seed_result[0]:
         return f'Client does not communicate with port provided on command line ({port})'
     if level_seed_result[1] != 8:
@@ -78,77 +86,116 @@ def test_level_seed(level, seed):
         return f'Seed sent by client ({level_seed_result[3]}) is different from that provided on command line ({seed}).'
     return ''
 
+def get_server_slots(server, port, max_in_flight):
+    with server_slots_lock:
+        if (server, port) not in server_slots:
+            server_slots[(server, port)] = \
+                    threading.BoundedSemaphore(max_in_flight)
+        return server_slots[(server, port)]
+
+def test_hunt(server, port, level, seed, max_in_flight):
+    # Run the client against the server, and return whether it passed, and
+    # what to print after the seed.
+    warn_msg = test_level_seed(level, seed)
+
+    cmd = ['strace', '-e', 'trace=%network',
+            CLIENT, server, str(port), str(level), str(seed)]
+    with get_server_slots(server, port, max_in_flight):
+        try:
+            p = subprocess.run(cmd,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    timeout=TIMEOUT)
+        except subprocess.TimeoutExpired:
+            treasure = b''
+            treasure_len = 0
+            strace_output = b''
+            h = ''
+        else:
+            treasure = p.stdout
+            if treasure and treasure.endswith(b'\n'):
+                treasure = treasure[:-1]
+            treasure_len = len(treasure)
+            strace_output = p.stderr
+            h = hashlib.sha1(treasure).hexdigest()
+
+    tot_bytes = 0
+    output = strace_output.decode('utf-8').strip()
+    for line in output.splitlines():
+        # skip DNS lookups
+        if 'htons(53)' in line:
+            continue
+        m = RECV_RE.search(line)
+        if m is not None:
+            received_bytes = int(m.group(2))
+            if received_bytes > 1:
+                tot_bytes += received_bytes - BYTES_MINUS_CHUNK
+
+    if h not in SUMS:
+        passed = False
+        msg = ' FAILED: output does not match'
+    elif tot_bytes != treasure_len:
+        passed = False
+        msg = ' FAILED: invalid number of bytes received'
+    else:
+        passed = True
+        msg = ' PASSED'
+    if warn_msg:
+        msg += f' (warning: {warn_msg})'
+    return passed, msg
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('server', action='store', type=str)
     parser.add_argument('port', action='store', type=int)
     parser.add_argument('level', action='store', type=int,
         nargs='?', choices=range(NUM_LEVELS))
+    parser.add_argument('-j', '--jobs', type=int, action='store',
+            default=JOBS, metavar='<num>',
+            help=f'Test up to <num> level/seed combinations at the same time (default: {JOBS}).')
+    parser.add_argument('-m', '--max-in-flight', type=int, action='store',
+            default=MAX_IN_FLIGHT, metavar='<num>',
+            help=f'Have no more than <num> clients talking to the server at the same time (default: {MAX_IN_FLIGHT}).')
     args = parser.parse_args(sys.argv[1:])
+    if args.jobs < 1 or args.max_in_flight < 1:
+        parser.error('--jobs and --max-in-flight must be at least 1')
 
     if args.level is None:
         levels = range(NUM_LEVELS)
     else:
         levels = [args.level]
 
+    # All the level/seed combinations are started at once, but only
+    # args.jobs run at a time, and only args.max_in_flight of those talk to
+    # the server at a time.  Results are printed in order, as soon as those
+    # before them are done.
     score = 0
     max_score = 0
-    for level in levels:
-        if level in LEVELS_EXTRA_CREDIT:
-            extra_credit_str = ' (extra credit)'
-        else:
-            extra_credit_str = ''
-        sys.stdout.write(f'Testing level {level}{extra_credit_str}:\n')
-        for seed in SEEDS:
-            if level not in LEVELS_EXTRA_CREDIT:
-                max_score += LEVEL_SCORES[level] / len(SEEDS)
-            sys.stdout.write(f'    Seed %5d:' % (seed))
-            sys.stdout.flush()
-
-            warn_msg = test_level_seed(level, seed)
-
-            cmd = ['strace', '-e', 'trace=%network',
-                    CLIENT, args.server, str(args.port), str(level), str(seed)]
-            try:
-                p = subprocess.run(cmd,
-                        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                        timeout=TIMEOUT)
-            except subprocess.TimeoutExpired:
-                treasure = b''
-                treasure_len = 0
-                strace_output = b''
-                h = ''
-            else:
-                treasure = p.stdout
-                if treasure and treasure.endswith(b'\n'):
-                    treasure = treasure[:-1]
-                treasure_len = len(treasure)
-                strace_output = p.stderr
-                h = hashlib.sha1(treasure).hexdigest()
-
-            tot_bytes = 0
-            output = strace_output.decode('utf-8').strip()
-            for line in output.splitlines():
-                # skip DNS lookups
-                if 'htons(53)' in line:
-                    continue
-                m = RECV_RE.search(line)
-                if m is not None:
-                    received_bytes = int(m.group(2))
-                    if received_bytes > 1:
-                        tot_bytes += received_bytes - BYTES_MINUS_CHUNK
-            
-            if h not in SUMS:
-                sys.stdout.write(f' FAILED: output does not match')
-            elif tot_bytes != treasure_len:
-                sys.stdout.write(f' FAILED: invalid number of bytes received')
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        futures = {}
+        for level in levels:
+            for seed in SEEDS:
+                futures[(level, seed)] = executor.submit(test_hunt,
+                        args.server, args.port, level, seed,
+                        args.max_in_flight)
+
+        for level in levels:
+            if level in LEVELS_EXTRA_CREDIT:
+                extra_credit_str = ' (extra credit)'
             else:
-                score += LEVEL_SCORES[level] / len(SEEDS)
-                sys.stdout.write(f' PASSED')
-            if warn_msg:
-                sys.stdout.write(f' (warning: {warn_msg})')
-            sys.stdout.write('\n')
-            
+                extra_credit_str = ''
+            sys.stdout.write(f'Testing level {level}{extra_credit_str}:\n')
+            for seed in SEEDS:
+                if level not in LEVELS_EXTRA_CREDIT:
+                    max_score += LEVEL_SCORES[level] / len(SEEDS)
+                sys.stdout.write(f'    Seed %5d:' % (seed))
+                sys.stdout.flush()
+
+                passed, msg = futures[(level, seed)].result()
+                if passed:
+                    score += LEVEL_SCORES[level] / len(SEEDS)
+                sys.stdout.write(msg + '\n')
+                sys.stdout.flush()
+
     print(f'Score: {score}/{max_score}')
             
 if __name__ == '__main__':
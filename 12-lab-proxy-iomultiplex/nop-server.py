@@ -0,0 +1,18 @@
+#!/usr/bin/python3
+#
+# nop-server.py - A server that accepts connections and never answers.  It is
+#                 shared by the proxy labs; it lives in ../code/proxytest.
+#
+# usage: nop-server.py [-t <bytes>] [-i <seconds>] [-r <seconds>]
+#                      [-s <seconds>] <port>
+#
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, 'code'))
+
+from proxytest.nopserver import main
+
+if __name__ == '__main__':
+    main()
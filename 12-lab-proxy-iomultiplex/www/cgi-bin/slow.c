@@ -1,16 +1,31 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <string.h>
-#include <unistd.h>
+#include <time.h>
+
+/* the most bytes generated at a time, however big the chunks */
+#define MAX_BUF_SIZE 65536
+
+/* sleep for seconds, which may be a fraction */
+void sleep_seconds(double seconds) {
+	struct timespec ts;
+	if (seconds <= 0) {
+		return;
+	}
+	ts.tv_sec = (time_t)seconds;
+	ts.tv_nsec = (long)((seconds - ts.tv_sec) * 1000000000);
+	while (nanosleep(&ts, &ts) < 0) {
+	}
+}
 
 int main(void) {
 
-	int size = 0;
-	int sleep_time = 0;
-	int chunk_size = 0;
+	long long size = 0;
+	double sleep_time = 0;
+	long long chunk_size = 0;
 
 	char *name = getenv("QUERY_STRING");
-	if (name != NULL) { 
+	if (name != NULL) {
 		do {
 			char *next_pair = strchr(name, '&');
 			if (next_pair != NULL) {
@@ -22,11 +37,11 @@ int main(void) {
 				*value = '\0';
 				value++;
 				if (strcmp(name, "size") == 0) {
-					size = atoi(value);
+					size = atoll(value);
 				} else if (strcmp(name, "sleep") == 0) {
-					sleep_time = atoi(value);
+					sleep_time = atof(value);
 				} else if (strcmp(name, "chunksize") == 0) {
-					chunk_size = atoi(value);
+					chunk_size = atoll(value);
 				}
 			}
 			name = next_pair;
@@ -36,29 +51,35 @@ int main(void) {
 	if (chunk_size <= 1) {
 		chunk_size = size/2;
 	}
+	if (chunk_size < 1) {
+		chunk_size = 1;
+	}
 
-	char *buf = malloc(sizeof(char) * (size + 1));
+	char *buf = malloc(sizeof(char) * MAX_BUF_SIZE);
 
 	/* Generate the HTTP response */
 	printf("Connection: close\r\n");
-	printf("Content-length: %d\r\n", size);
+	printf("Content-length: %lld\r\n", size);
 	printf("Content-type: text/plain\r\n\r\n");
 	fflush(stdout);
-	int i = 0, j = 0;
+	long long i = 0;
+	int j = 0;
 	while (i < size) {
-		sleep(sleep_time);
-		int chunk = i + chunk_size;
+		sleep_seconds(sleep_time);
+		long long chunk = i + chunk_size;
 		if (chunk > size) {
 			chunk = size;
 		}
-		for (j = 0; i < chunk; i++, j++) {
-			buf[j] = '0' + (i % 10);
-			if (buf[j] == '0') {
-				buf[j] = '\n';
+		while (i < chunk) {
+			for (j = 0; i < chunk && j < MAX_BUF_SIZE; i++, j++) {
+				buf[j] = '0' + (i % 10);
+				if (buf[j] == '0') {
+					buf[j] = '\n';
+				}
 			}
+			fwrite(buf, 1, j, stdout);
 		}
-		buf[j] = '\0';
-		printf("%s", buf);
 		fflush(stdout);
 	}
+	free(buf);
 }
@@ -0,0 +1,24 @@
+# proxytest - The test driver shared by the HTTP proxy labs.
+#
+# The labs run it through their driver.py; see proxytest.cli.  Names are
+# imported from their modules the first time they are used, so that importing
+# the package (e.g., just to parse the command line) stays cheap.
+
+import importlib
+
+_EXPORTS = {
+        'ProxyTestSuite': 'suite',
+        'ProxyTest': 'cases',
+        'ProxyBenchmark': 'bench',
+        'HTTPFetcher': 'fetch',
+        'PortAllocator': 'ports',
+        'ReferenceStore': 'references',
+        'ResourceSampler': 'resources',
+        'main': 'cli',
+        }
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    module = importlib.import_module('.' + _EXPORTS[name], __name__)
+    return getattr(module, name)
@@ -0,0 +1,180 @@
+# proxytest/bench.py - Measuring the throughput and latency of the proxy.
+
+import asyncio
+import math
+import os
+import random
+import time
+
+from .cases import ProxyTest
+from .config import BENCH_MIX
+from .errors import FailedCommand
+from .fetch import FETCH_ERRORS, FETCH_OK
+
+def percentile(sorted_values, p):
+    # nearest-rank percentile of a sorted list
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+def latency_stats(latencies):
+    latencies = sorted(latencies)
+    return {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+            }
+
+# What the benchmarks have in common: their results are in a report, which is
+# set by run() and which cleanup() completes with what was learned about the
+# proxy once it was stopped.
+class BenchmarkTest(ProxyTest):
+    TIMEOUT = 10
+
+    def __init__(self, *args, **kwargs):
+        # set by run()
+        self.report = None
+
+        super(BenchmarkTest, self).__init__(*args, **kwargs)
+
+    def _direct_reference(self, url, name):
+        # the expected content of url, which must be retrievable directly
+        dst_path_noproxy = os.path.join(self.noproxy_dir,
+                self._filesystem_safe(name))
+        ref = self.reference(url, dst_path_noproxy, self.TIMEOUT)
+        if ref.wait() != FETCH_OK:
+            raise FailedCommand('Unable to retrieve %s directly' % (url))
+        return ref
+
+    def _status(self, f, ref):
+        # why the fetch f failed, or None if it got the content of ref
+        status = f.wait()
+        if status != FETCH_OK:
+            return FETCH_ERRORS.get(status, str(status))
+        if f.digest != ref.digest:
+            return 'mismatch'
+        return None
+
+    def cleanup(self):
+        super(BenchmarkTest, self).cleanup()
+        if self.report is None:
+            return
+        if self.probe is not None:
+            self.report['concurrency_model'] = self.probe.summary()
+        self.report['memory_checker'] = self.mem_check
+        if self.leak_summary is not None:
+            self.report['leaks'] = self.leak_summary
+
+class ProxyBenchmark(BenchmarkTest):
+    DESCRIPTION = 'Proxy Benchmark'
+    EXTENDED_DESCRIPTION = \
+            'Issuing a mix of requests to the proxy, under load, and ' + \
+            'measuring throughput and latency.'
+
+    # (file, weight) pairs
+    MIX = BENCH_MIX
+
+    def __init__(self, *args, mix=None, duration=10, concurrency=10,
+            rate=None, **kwargs):
+        if mix is not None:
+            self.MIX = mix
+        self.FILES = [f for (f, weight) in self.MIX]
+        self.duration = duration
+        self.concurrency = concurrency
+        self.rate = rate
+
+        super(ProxyBenchmark, self).__init__(*args, **kwargs)
+
+    async def _generate_load(self, urls, weights):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.duration
+        fetches = []
+
+        async def fetch():
+            url = random.choices(urls, weights)[0]
+            f = await self.fetcher.fetch_async(url, None, self.TIMEOUT,
+                    proxy=self.proxy_url)
+            fetches.append((url, f))
+
+        if self.rate is None:
+            # closed loop: each client issues its next request as soon as the
+            # previous one is done
+            async def client():
+                while loop.time() < deadline:
+                    await fetch()
+            await asyncio.gather(*[client() for i in range(self.concurrency)])
+        else:
+            # open loop: requests are issued at a fixed rate, regardless of
+            # how many are still outstanding
+            tasks = []
+            next_time = loop.time()
+            while next_time < deadline:
+                tasks.append(asyncio.ensure_future(fetch()))
+                next_time += 1 / self.rate
+                await asyncio.sleep(max(0, next_time - loop.time()))
+            await asyncio.gather(*tasks)
+        return fetches
+
+    def _summarize(self, fetches, files, refs, elapsed):
+        errors = {}
+        latencies = []
+        by_file = {}
+        tot_bytes = 0
+        for (url, f) in fetches:
+            stats = by_file.setdefault(files[url],
+                    { 'requests': 0, 'errors': 0, 'latencies': [] })
+            stats['requests'] += 1
+            tot_bytes += f.size
+
+            error = self._status(f, refs[url])
+            if error is not None:
+                errors[error] = errors.get(error, 0) + 1
+                stats['errors'] += 1
+            else:
+                latencies.append(f.latency)
+                stats['latencies'].append(f.latency)
+
+        for stats in by_file.values():
+            stats['latency'] = latency_stats(stats.pop('latencies'))
+
+        return {
+                'mode': self.mode,
+                'origin': self.origin,
+                'concurrency': self.concurrency if self.rate is None else None,
+                'rate': self.rate,
+                'duration': elapsed,
+                'requests': len(fetches),
+                'errors': errors,
+                'requests_per_sec': len(fetches) / elapsed,
+                'bytes_per_sec': tot_bytes / elapsed,
+                'latency': latency_stats(latencies),
+                'files': by_file,
+                'resources': self.sampler.summary(),
+                }
+
+    def run(self):
+        urls = ['http://%s:%d/%s' % (self.server_host, self.server_port, f)
+                for (f, weight) in self.MIX]
+        weights = [weight for (f, weight) in self.MIX]
+        files = dict(zip(urls, self.FILES))
+
+        refs = {}
+        for (i, (url, filename)) in enumerate(files.items()):
+            refs[url] = self._direct_reference(url, '%s-%d' % (filename, i))
+
+        if self.rate is None:
+            self.logger.info('Running %d clients for %.1f seconds' % \
+                    (self.concurrency, self.duration))
+        else:
+            self.logger.info('Issuing %.1f requests per second for %.1f seconds' % \
+                    (self.rate, self.duration))
+        start_time = time.monotonic()
+        fetches = self.fetcher.run(self._generate_load(urls, weights))
+        elapsed = time.monotonic() - start_time
+        self.sampler.sample()
+
+        self.report = self._summarize(fetches, files, refs, elapsed)
+        self.attempts = self.report['requests']
+        self.successes = self.attempts - sum(self.report['errors'].values())
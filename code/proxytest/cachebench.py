@@ -0,0 +1,225 @@
+# proxytest/cachebench.py - Measuring how well the proxy caches.
+
+import asyncio
+import random
+import re
+import time
+
+from .bench import BenchmarkTest, latency_stats
+from .config import CACHE_MAX_OBJECT_SIZE, CACHE_MAX_SIZE, CACHE_SIZES
+from .fetch import FETCH_OK
+
+# the parameter that identifies the object requested, in each URL
+OBJECT_RE = re.compile(rb'[?&]cache-obj=(\d+)')
+
+# Replays a stream of requests for a set of objects, whose popularity follows
+# a Zipf distribution, and whose sizes follow a given distribution.  Each
+# object is a response of cgi-bin/slow, so its content depends only on its
+# size.  Whether a request was a hit is told by whether the origin server saw
+# it: each request for an object that the server logs is matched with the
+# request that caused it, i.e., the last one for that object sent before the
+# log line was read.
+#
+# Once the stream is done, every object that was requested is requested once
+# more, from the most to the least recently requested.  Each object that is
+# then a hit must have been in the cache when this began, so their total size
+# is a lower bound on the size of the cache, which is checked against its
+# limit.  No object larger than the maximum object size should ever be a hit.
+class CacheBenchmark(BenchmarkTest):
+    DESCRIPTION = 'Cache Benchmark'
+    EXTENDED_DESCRIPTION = \
+            'Issuing a stream of requests for objects, some more popular ' + \
+            'than others, to the proxy, and measuring its hit ratio.'
+
+    SLOW_FILE = 'cgi-bin/slow?size=%d'
+    TIMEOUT = 10
+    # the stream is the same from one run to the next
+    SEED = 0
+
+    def __init__(self, *args, objects=200, requests=2000, zipf=1.0,
+            sizes=None, concurrency=1, max_size=CACHE_MAX_SIZE,
+            max_object_size=CACHE_MAX_OBJECT_SIZE, **kwargs):
+        if sizes is None:
+            sizes = CACHE_SIZES
+        self.objects = objects
+        self.num_requests = requests
+        self.zipf = zipf
+        self.sizes = sizes
+        self.concurrency = concurrency
+        self.max_size = max_size
+        self.max_object_size = max_object_size
+        self.FILES = [self.SLOW_FILE % (size) for (size, weight) in sizes]
+
+        super(CacheBenchmark, self).__init__(*args, **kwargs)
+
+    def _url(self, size, obj=None):
+        url = 'http://%s:%d/%s' % \
+                (self.server_host, self.server_port, self.SLOW_FILE % (size))
+        if obj is not None:
+            url += '&cache-obj=%d' % (obj)
+        return url
+
+    def _stream(self):
+        rng = random.Random(self.SEED)
+        object_sizes = rng.choices([size for (size, weight) in self.sizes],
+                [weight for (size, weight) in self.sizes], k=self.objects)
+        # the popularity of an object is unrelated to its size
+        ranks = list(range(1, self.objects + 1))
+        rng.shuffle(ranks)
+        weights = [1 / (rank ** self.zipf) for rank in ranks]
+        stream = rng.choices(range(self.objects), weights, k=self.num_requests)
+        return object_sizes, stream
+
+    async def _replay(self, stream, object_sizes, concurrency):
+        # (object, Fetch) for each request, in the order they were sent
+        fetches = []
+        pending = iter(stream)
+
+        async def client():
+            for obj in pending:
+                url = self._url(object_sizes[obj], obj)
+                i = len(fetches)
+                fetches.append(None)
+                f = await self.fetcher.fetch_async(url, None, self.TIMEOUT,
+                        proxy=self.proxy_url)
+                fetches[i] = (obj, f)
+
+        await asyncio.gather(*[client() for i in range(concurrency)])
+        return fetches
+
+    def _sync_server_log(self):
+        # The server logs requests in the order it gets them, so once a request
+        # made after all the others has been logged, so have they.
+        url = 'http://%s:%d/foo.html?cache-sync' % \
+                (self.server_host, self.server_port)
+        self.fetcher.fetch(url, None, self.TIMEOUT).wait()
+        if not self.wait_for_server_requests('cache-sync', 1, self.TIMEOUT):
+            self.logger.warning('The server did not log a request for %s; hits may be overcounted.' % (url))
+
+    def _origin_requests(self):
+        # the times at which the server log showed each object being requested
+        times = {}
+        with self.server_log_cond:
+            lines = list(zip(self.server_log, self.server_log_times))
+        for (line, t) in lines:
+            m = OBJECT_RE.search(line)
+            if m is not None:
+                times.setdefault(int(m.group(1)), []).append(t)
+        return times
+
+    def _classify(self, fetches):
+        # whether each request was a miss, i.e., reached the origin server
+        by_object = {}
+        for (i, (obj, f)) in enumerate(fetches):
+            by_object.setdefault(obj, []).append(i)
+        misses = [False] * len(fetches)
+        for (obj, times) in self._origin_requests().items():
+            unmatched = by_object.get(obj, [])
+            for t in sorted(times):
+                sent = [i for i in unmatched if fetches[i][1].start_time <= t]
+                if not sent:
+                    continue
+                i = max(sent, key=lambda i: fetches[i][1].start_time)
+                misses[i] = True
+                unmatched.remove(i)
+        return misses
+
+    def _summarize(self, fetches, misses, object_sizes, refs, elapsed):
+        errors = {}
+        latencies = { 'hit': [], 'miss': [] }
+        hits = 0
+        oversize_hits = 0
+        for ((obj, f), miss) in zip(fetches, misses):
+            size = object_sizes[obj]
+            error = self._status(f, refs[size])
+            if error is not None:
+                errors[error] = errors.get(error, 0) + 1
+                continue
+            if miss:
+                latencies['miss'].append(f.latency)
+                continue
+            hits += 1
+            latencies['hit'].append(f.latency)
+            if size > self.max_object_size:
+                oversize_hits += 1
+        successes = len(fetches) - sum(errors.values())
+        distinct = len(set([obj for (obj, f) in fetches]))
+        return {
+                'requests': len(fetches),
+                'errors': errors,
+                'hits': hits,
+                'misses': successes - hits,
+                'hit_ratio': hits / successes if successes else None,
+                # the hit ratio of a cache of unlimited size
+                'max_hit_ratio': 1 - distinct / len(fetches),
+                'oversize_hits': oversize_hits,
+                'duration': elapsed,
+                'latency': dict([(k, latency_stats(v))
+                    for (k, v) in latencies.items()]),
+                }
+
+    def _check_limits(self, probes, misses, object_sizes):
+        cached = [obj for ((obj, f), miss) in zip(probes, misses)
+                if not miss and f.wait() == FETCH_OK]
+        cached_bytes = sum([object_sizes[obj] for obj in cached])
+        oversize = [obj for obj in cached
+                if object_sizes[obj] > self.max_object_size]
+        if cached_bytes > self.max_size:
+            self.logger.warning('At least %d bytes were cached at once; the limit is %d.' % \
+                    (cached_bytes, self.max_size))
+        return {
+                'max_size': self.max_size,
+                'max_object_size': self.max_object_size,
+                'cached_objects': len(cached),
+                'cached_bytes': cached_bytes,
+                'oversize_objects': len(oversize),
+                }
+
+    def run(self):
+        object_sizes, stream = self._stream()
+
+        refs = {}
+        for (size, weight) in self.sizes:
+            refs[size] = self._direct_reference(self._url(size),
+                    self.SLOW_FILE % (size))
+
+        self.logger.info('Replaying %d requests for %d objects with %d clients' % \
+                (self.num_requests, self.objects, self.concurrency))
+        start_time = time.monotonic()
+        fetches = self.fetcher.run(self._replay(stream, object_sizes,
+            self.concurrency))
+        elapsed = time.monotonic() - start_time
+        self.sampler.sample()
+
+        # every object requested, from the most to the least recently
+        # requested, one at a time
+        recent = list(dict.fromkeys([obj for (obj, f) in reversed(fetches)]))
+        self.logger.info('Requesting each of %d objects once more' % (len(recent)))
+        probes = self.fetcher.run(self._replay(recent, object_sizes, 1))
+
+        self._sync_server_log()
+        misses = self._classify(fetches + probes)
+
+        self.report = {
+                'mode': self.mode,
+                'origin': self.origin,
+                'objects': self.objects,
+                'zipf': self.zipf,
+                'sizes': self.sizes,
+                'concurrency': self.concurrency,
+                'resources': self.sampler.summary(),
+                }
+        self.report.update(self._summarize(fetches, misses[:len(fetches)],
+            object_sizes, refs, elapsed))
+        self.report['limits'] = self._check_limits(probes,
+                misses[len(fetches):], object_sizes)
+        if self.report['oversize_hits']:
+            self.logger.warning('%d requests for objects larger than %d bytes were hits.' % \
+                    (self.report['oversize_hits'], self.max_object_size))
+        limits = self.report['limits']
+        limits['success'] = limits['cached_bytes'] <= self.max_size and \
+                limits['oversize_objects'] == 0 and \
+                self.report['oversize_hits'] == 0
+
+        self.attempts = self.report['requests']
+        self.successes = self.attempts - sum(self.report['errors'].values())
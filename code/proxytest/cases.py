@@ -0,0 +1,903 @@
+# proxytest/cases.py - The proxy tests.
+
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from .compare import compare_files, file_digest, file_excerpt
+from .config import NOP_SERVER, ORIGIN_SERVER, PROXY, SLOW_CLIENT, STRACE, \
+        CONCURRENCY_SLACK, LEAK_SITES, WWW_DIR
+from .errors import FailedCommand, MissingFile
+from .fetch import FETCH_ERRORS, FETCH_OK, HTTPFetcher
+from .nopserver import REPORT_RE
+from .ports import PortAllocator
+from .probes import EPOLL_WAIT_SYSCALLS, PROBES
+from .processes import MEM_CHECK_ESCALATION, ProcessSupervisor
+from .readiness import wait_until, wait_until_stable
+from .references import Reference, ReferenceStore
+from .resources import ResourceSampler
+
+class ProxyTest:
+    DESCRIPTION = 'Proxy Test'
+    FILES = []
+
+    port_allocator = PortAllocator()
+    fetcher = HTTPFetcher()
+    references = ReferenceStore()
+
+    def __init__(self, proxy_host='localhost', proxy_port=None,
+            server_host='localhost', server_port=None,
+            mem_check='memcheck', keep_files=False,
+            server_output=False, proxy_output=False,
+            verbose=False, sample_interval=0.1,
+            mode=None, trace_epoll=False, valgrind_xml=False,
+            origin='http.server'):
+
+        self.logger = logging.getLogger('.')
+        self.ports = []
+        # the server, proxy and nop-server processes
+        self.processes = ProcessSupervisor()
+
+        self.server_host = server_host
+        # 'http.server', or 'stand-in' for the server in origin.py
+        self.origin = origin
+        if server_port is None:
+            server_port = self._reserve_port()
+        self.server_port = server_port
+        self.server_proc = None
+
+        self.proxy_host = proxy_host
+        if proxy_port is None:
+            proxy_port = self._reserve_port()
+        self.proxy_port = proxy_port
+        self.proxy_proc = None
+        self.proxy_pid = None
+        self.proxy_url = 'http://%s:%d' % (self.proxy_host, proxy_port)
+
+        self.nop_server_host = 'localhost'
+        self.nop_server_port = self._reserve_port()
+        self.nop_server_proc = None
+        # the number of connections that nop-server.py reports it is holding
+        self.nop_server_connections = 0
+        self.nop_server_cond = threading.Condition()
+
+        self.server_log = []
+        # the time.monotonic() value at which each line of the server log was
+        # read
+        self.server_log_times = []
+        self.server_log_cond = threading.Condition()
+
+        self.proxy_dir = tempfile.mkdtemp(prefix='proxy_', dir='.')
+        self.logger.info('Created temporary directory for files downloaded from the proxy: %s.', self.proxy_dir)
+        self.noproxy_dir = tempfile.mkdtemp(prefix='noproxy_', dir='.')
+        self.logger.info('Created temporary directory for files downloaded directly from the server: %s.', self.noproxy_dir)
+        if mem_check is not None:
+            fd, self.mem_log_file = tempfile.mkstemp(prefix='log_', dir='.')
+            self.logger.info('Created temporary file for %s output: %s.', mem_check, self.mem_log_file)
+            os.close(fd)
+        else:
+            self.mem_log_file = None
+        if trace_epoll:
+            fd, self.strace_log_file = tempfile.mkstemp(prefix='strace_', dir='.')
+            self.logger.info('Created temporary file for strace output: %s.', self.strace_log_file)
+            os.close(fd)
+        else:
+            self.strace_log_file = None
+
+        self.mem_check = mem_check
+        if mem_check is not None:
+            # only needed with a memory checker, so only imported then
+            from .memcheck import MEMORY_CHECKERS
+            kwargs = {}
+            if mem_check == 'memcheck':
+                kwargs.update(xml=valgrind_xml)
+            self.mem_checker = MEMORY_CHECKERS[mem_check](self.mem_log_file,
+                    sample_interval, **kwargs)
+        else:
+            self.mem_checker = None
+        self.keep_files = keep_files
+        self.server_output = server_output
+        self.proxy_output = proxy_output
+        self.verbose = verbose
+        self.sample_interval = sample_interval
+        self.sampler = None
+        self.mode = mode
+        self.probe = None
+
+        # the number of requests in flight when the concurrency model is
+        # checked; set by run()
+        self.probe_connections = None
+
+        # these are set by run()
+        self.num_processes_pre = None
+        self.num_processes_realtime = None
+        self.num_threads_pre = None
+        self.num_threads_realtime = None
+
+        # these are set by run()
+        self.attempts = None
+        self.successes = None
+        # the outcome of each request checked by run(); see _record_request()
+        self.requests = []
+        # the time taken by run(); set by whoever runs the test
+        self.run_time = None
+
+        # these are set by cleanup()
+        self.mem_mgmt = None
+        self.mem_cleanup = None
+        self.leak_summary = None
+        self.leaks = None
+
+        self._check_files()
+
+        self.start_server()
+        self.start_proxy()
+
+        # Wait for threads (or processes) to be initialized
+        self.wait_for_proxy_tasks(2)
+
+        self.sampler = ResourceSampler(self.proxy_pid, self.sample_interval)
+        self.sampler.start()
+        self.sampler.sample()
+        self.num_threads_pre = self.sampler.latest('threads')
+        self.num_processes_pre = self.sampler.latest('processes')
+
+        probe_cls = PROBES.get(self.mode)
+        if probe_cls is not None:
+            kwargs = {}
+            if self.strace_log_file is not None:
+                kwargs.update(trace_file=self.strace_log_file)
+            self.probe = probe_cls(self.proxy_pid, self.sample_interval, **kwargs)
+            self.probe.start()
+
+    def __del__(self):
+        self.cleanup_processes()
+        if not self.keep_files:
+            self.cleanup_files()
+        self._release_ports()
+
+    @classmethod
+    def get_num_processes(cls, pid):
+        children = ResourceSampler.read_children(pid)
+        if children is None:
+            return 0
+        return len(children) + 1
+
+    @classmethod
+    def get_num_threads(cls, pid):
+        threads = ResourceSampler.read_threads(pid)
+        if threads is None:
+            return 0
+        return threads
+
+    def wait_for_proxy_tasks(self, timeout):
+        # Wait until the number of threads and processes of the proxy has
+        # stopped changing, but no more than timeout seconds.
+        pid = self.proxy_pid
+        return wait_until_stable(
+                lambda: (self.get_num_threads(pid), self.get_num_processes(pid)),
+                timeout)
+
+    def _read_server_log(self, fh):
+        for line in fh:
+            if self.server_output:
+                self.server_output.write(line)
+                self.server_output.flush()
+            with self.server_log_cond:
+                self.server_log.append(line)
+                self.server_log_times.append(time.monotonic())
+                self.server_log_cond.notify_all()
+        fh.close()
+
+    def count_server_requests(self, pattern):
+        # the number of requests logged by the server whose request line
+        # contains pattern
+        pattern = pattern.encode('utf-8')
+        with self.server_log_cond:
+            return len([l for l in self.server_log if pattern in l])
+
+    def wait_for_server_requests(self, pattern, count, timeout):
+        # Wait until the server has logged at least count requests whose
+        # request line contains pattern, but no more than timeout seconds.
+        def enough():
+            return self.count_server_requests(pattern) >= count
+        with self.server_log_cond:
+            return self.server_log_cond.wait_for(enough, timeout)
+
+    @classmethod
+    def port_in_use(cls, port):
+        return cls.port_allocator.port_in_use(port)
+
+    @classmethod
+    def wait_for_port_use(cls, port, timeout):
+        cls.port_allocator.wait_for_port_use(port, timeout)
+
+    @classmethod
+    def find_free_port(cls):
+        return cls.port_allocator.reserve()
+
+    def _reserve_port(self):
+        port = self.find_free_port()
+        self.ports.append(port)
+        return port
+
+    def _release_ports(self):
+        for port in self.ports:
+            self.port_allocator.release(port)
+        self.ports = []
+
+    def check_mode(self, mode):
+        if self.num_processes_realtime is None or \
+                self.num_processes_pre is None or \
+                self.num_threads_realtime is None or \
+                self.num_threads_pre is None:
+            return None
+
+        status = True
+        if self.num_processes_realtime > self.num_processes_pre:
+            if mode == 'multiprocess':
+                level = logging.INFO
+            else:
+                level = logging.ERROR
+                status = False
+            self.logger.log(level, 'Processes are being forked on the fly: (%d > %d)' % (self.num_processes_realtime, self.num_processes_pre))
+        if self.num_processes_pre > 1:
+            if mode == 'processpool':
+                level = logging.INFO
+            else:
+                level = logging.ERROR
+                status = False
+            self.logger.log(level, 'A pool of %d processes was created a program start.' % (self.num_threads_pre - 1))
+        if self.num_threads_realtime > self.num_threads_pre:
+            if mode == 'multithread':
+                level = logging.INFO
+            else:
+                level = logging.ERROR
+                status = False
+            self.logger.log(level, 'Threads are being spawned on the fly: (%d > %d)' % (self.num_threads_realtime, self.num_threads_pre))
+        if self.num_threads_pre > 2:
+            if mode == 'threadpool':
+                level = logging.INFO
+            else:
+                level = logging.ERROR
+                status = False
+            self.logger.log(level, 'A pool of %d threads was created a program start.' % (self.num_threads_pre - 2))
+        if self.probe is not None and self.probe_connections is not None:
+            if not self.probe.check(self, self.probe_connections):
+                status = False
+        return status
+
+    def _cleanup_processes(self, kill_proxy, kill_server, kill_nop):
+        procs = []
+        if kill_proxy:
+            if self.mem_checker is not None:
+                # give it time to check for leaks as it exits
+                self.processes.stop([self.proxy_proc], MEM_CHECK_ESCALATION)
+            else:
+                procs.append(self.proxy_proc)
+        if kill_server:
+            procs.append(self.server_proc)
+        if kill_nop:
+            procs.append(self.nop_server_proc)
+        self.processes.stop(procs)
+
+    def cleanup_processes(self):
+        self.logger.info('Cleaning up all processes.')
+        self._cleanup_processes(kill_server=True, kill_proxy=True, kill_nop=True)
+
+    def kill_server(self):
+        self.logger.info('Killing the server process.')
+        self._cleanup_processes(kill_server=True, kill_proxy=False, kill_nop=False)
+
+    def cleanup_files(self):
+        files = [self.proxy_dir, self.noproxy_dir]
+        if self.mem_checker is not None:
+            files += self.mem_checker.log_files()
+        if self.strace_log_file is not None:
+            files.append(self.strace_log_file)
+        self.logger.info('Removing temporary files: %s' % (', '.join(files)))
+        subprocess.call(['rm', '-r', '-f'] + files, stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT)
+
+    def cleanup(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.cleanup_processes()
+        if self.probe is not None:
+            self.probe.stop()
+        if self.mem_checker is not None:
+            self.check_memory()
+        if self.keep_files:
+            msg = 'Proxy Directory: %s\nNo Proxy Directory: %s' % \
+                    (self.proxy_dir, self.noproxy_dir)
+            if self.mem_checker is not None:
+                msg += '\n%s log files: %s' % (self.mem_check,
+                        ', '.join(self.mem_checker.log_files()))
+            if self.strace_log_file is not None:
+                msg += '\nstrace log file: %s' % (self.strace_log_file)
+            self.logger.info(msg)
+        else:
+            self.cleanup_files()
+        self._release_ports()
+
+    def _check_files(self):
+        for f in self.FILES:
+            if f.startswith('http://'):
+                continue
+            qs_index = f.find('?')
+            if qs_index > -1:
+                f = f[:qs_index]
+            f = os.path.join(WWW_DIR, f)
+            if not os.path.exists(f):
+                raise MissingFile('File "%s" not found' % f)
+
+        for f in (SLOW_CLIENT, NOP_SERVER):
+            if not os.path.exists(f):
+                raise MissingFile('File "%s" not found' % f)
+
+        # Check for the proxy, as run by the memory checker
+        if self.mem_checker is not None:
+            self.mem_checker.check_installed()
+        if not os.path.exists(self.proxy_executable):
+            raise MissingFile('File "%s" not found' % self.proxy_executable)
+
+        # Check for strace
+        if self.strace_log_file is not None:
+            try:
+                subprocess.call([STRACE, '-V'], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            except OSError:
+                raise FailedCommand('Unable to run strace.  Is it installed and in PATH?')
+
+    @property
+    def proxy_executable(self):
+        if self.mem_checker is not None:
+            return self.mem_checker.PROXY
+        return PROXY
+
+    def check_memory(self):
+        returncode = None
+        if self.proxy_proc is not None:
+            returncode = self.proxy_proc.poll()
+        parser = self.mem_checker.finish(returncode)
+
+        # A proxy that was killed by a signal, rather than exiting when it
+        # received SIGINT, did not shut down cleanly, and fails whatever
+        # checker was used: LeakSanitizer reports nothing for it, and what
+        # memcheck reports is only kept for information.
+        killed = returncode is None or returncode < 0
+        if killed:
+            self.logger.warning('The proxy was killed (%s) rather than exiting when it received SIGINT, so its memory management fails with %s.' % \
+                    (returncode, self.mem_check))
+            self.mem_mgmt = False
+            if self.mem_checker.REPORTS_REACHABLE:
+                self.mem_cleanup = False
+        if parser is None:
+            return
+
+        status = parser.summary
+        self.leak_summary = status
+        self.leaks = parser.by_site()
+
+        if not killed:
+            if status.get('definitely_lost', 0) > 0 or \
+                    status.get('indirectly_lost', 0) > 0:
+                self.mem_mgmt = False
+            else:
+                self.mem_mgmt = True
+            if not self.mem_checker.REPORTS_REACHABLE:
+                self.mem_cleanup = None
+            elif status.get('still_reachable', 0) > 0:
+                self.mem_cleanup = False
+            else:
+                self.mem_cleanup = True
+            if not self.mem_mgmt:
+                self.logger.warning('Memory directly or indirectly lost!')
+            if self.mem_cleanup is False:
+                self.logger.warning('Memory still reachable at process end; shutdown not clean!')
+
+        for error in parser.errors:
+            self.logger.warning(error)
+        for leak in self.leaks[:LEAK_SITES]:
+            self.logger.debug('%d bytes in %d blocks %s, allocated at:\n    %s' % \
+                    (leak['bytes'], leak['blocks'], leak['category'],
+                        '\n    '.join(leak['site'])))
+
+    def start_server(self):
+        self.logger.info('Starting server on port %d' % self.server_port)
+        if self.origin == 'stand-in':
+            cmd = [sys.executable, ORIGIN_SERVER, str(self.server_port)]
+        else:
+            cmd = ['python3', '-m', 'http.server', '--cgi', str(self.server_port)]
+        # the server log is read by the driver, to know which requests have
+        # reached the server, and copied to server_output, if specified
+        kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.logger.debug(' '.join(cmd))
+        self.server_proc = self.processes.start(cmd, cwd=WWW_DIR, **kwargs)
+        t = threading.Thread(target=self._read_server_log,
+                args=(self.server_proc.stdout,), daemon=True)
+        t.start()
+        self.wait_for_port_use(self.server_port, 5)
+
+    def start_proxy(self):
+        self.logger.info('Starting proxy on port %d' % self.proxy_port)
+        cmd = [self.proxy_executable, str(self.proxy_port)]
+        if self.mem_checker is not None:
+            cmd = self.mem_checker.command(cmd)
+        if self.strace_log_file is not None:
+            cmd = [STRACE, '-f', '-o', self.strace_log_file,
+                    '-e', 'trace=%s' % (','.join(EPOLL_WAIT_SYSCALLS))] + cmd
+        kwargs = {}
+        if self.proxy_output:
+            kwargs.update(stdout=self.proxy_output, stderr=subprocess.STDOUT)
+        else:
+            kwargs.update(stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        if self.mem_checker is not None:
+            kwargs.update(env=self.mem_checker.env())
+        self.logger.debug(' '.join(cmd))
+        self.proxy_proc = self.processes.start(cmd, **kwargs)
+        if self.mem_checker is not None:
+            self.mem_checker.start()
+        self.wait_for_port_use(self.proxy_port, 5)
+
+        if self.strace_log_file is None:
+            # valgrind, like the proxy itself, runs in the same process
+            self.proxy_pid = self.proxy_proc.pid
+        else:
+            # the proxy is the (only) child of strace
+            children = wait_until(
+                    lambda: ResourceSampler.read_children(self.proxy_proc.pid), 5)
+            if not children:
+                raise FailedCommand('Unable to find the proxy process run by strace')
+            self.proxy_pid = min(children)
+
+    def start_nop_server(self, *args):
+        # args are options for nop-server.py, e.g., to trickle bytes or reset
+        # connections; see proxytest/nopserver.py
+        self.logger.info('Starting nop-server on port %d' % self.nop_server_port)
+        cmd = [NOP_SERVER, '-s', str(self.sample_interval)] + list(args) + \
+                [str(self.nop_server_port)]
+        kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.logger.debug(' '.join(cmd))
+        self.nop_server_proc = self.processes.start(cmd, **kwargs)
+        t = threading.Thread(target=self._read_nop_server_log,
+                args=(self.nop_server_proc.stdout,), daemon=True)
+        t.start()
+        self.wait_for_port_use(self.nop_server_port, 5)
+
+    def _read_nop_server_log(self, fh):
+        for line in fh:
+            line = line.decode('utf-8', 'replace').rstrip()
+            self.logger.debug('nop-server: %s' % (line))
+            m = REPORT_RE.search(line)
+            if m is not None:
+                with self.nop_server_cond:
+                    self.nop_server_connections = int(m.group(1))
+                    self.nop_server_cond.notify_all()
+        fh.close()
+
+    def wait_for_nop_connections(self, count, timeout):
+        # Wait until nop-server.py holds at least count connections, but no
+        # more than timeout seconds.
+        with self.nop_server_cond:
+            return self.nop_server_cond.wait_for(
+                    lambda: self.nop_server_connections >= count, timeout)
+
+    def _filesystem_safe(self, s):
+        return ''.join([c for c in s if c.isalpha() or c.isdigit() or c == '-']).rstrip()
+
+    def _download_proxy(self, url, output, timeout):
+        self.logger.info('Fetching %s into %s - through proxy' % (url, output))
+        # create an empty file
+        open(output, 'w').close()
+        self.logger.debug('GET %s (proxy: %s, max time: %ds)' % \
+                (url, self.proxy_url, timeout))
+        return self.fetcher.fetch(url, output, timeout, proxy=self.proxy_url)
+
+    def _download_proxy_slow(self, url, output, timeout, sleep_between_send=1):
+        self.logger.info('Fetching %s into %s - through proxy' % (url, output))
+        # create an empty file
+        open(output, 'w').close()
+        self.logger.debug('GET %s (proxy: %s, max time: %ds, sleep between send: %ds)' % \
+                (url, self.proxy_url, timeout, sleep_between_send))
+        return self.fetcher.fetch(url, output, timeout, proxy=self.proxy_url,
+                sleep_between_send=sleep_between_send)
+
+    def download_proxy(self, url, output, timeout):
+        raise NotImplemented
+
+    def download_noproxy(self, url, output, timeout):
+        # The content downloaded directly is only kept in a file if the files
+        # are to be kept; otherwise only its digest is kept, for comparison.
+        if self.keep_files:
+            self.logger.info('Fetching %s into %s - direct from server' % (url, output))
+            # create an empty file
+            open(output, 'w').close()
+        else:
+            self.logger.info('Fetching %s - direct from server' % (url))
+            output = None
+        self.logger.debug('GET %s (max time: %ds)' % (url, timeout))
+        return self.fetcher.fetch(url, output, timeout)
+
+    def time_noproxy(self, url, timeout):
+        # fetch url directly, only to time it
+        self.logger.debug('GET %s (max time: %ds) - direct from server, for timing' % \
+                (url, timeout))
+        return self.fetcher.fetch(url, None, timeout)
+
+    def reference(self, url, output, timeout):
+        # Return the expected content of url, as a Reference or a Fetch.  If it
+        # has to be downloaded (directly), it is downloaded into output.
+        netloc = '%s:%d' % (self.server_host, self.server_port)
+        ref = self.references.get(url, netloc,
+                lambda u: self.download_noproxy(u, output, timeout),
+                lambda u: self.time_noproxy(u, timeout))
+        if isinstance(ref, Reference):
+            self.logger.info('Using %s as the content of %s' % (ref.output, url))
+        return ref
+
+    def _compare(self, expected, file2):
+        # expected is either the name of a file or a finished Fetch or
+        # Reference, whose content is compared by digest if it is not in a
+        # file.  Return None if the content of file2 is the same, or else why
+        # not.
+        if isinstance(expected, str):
+            file1 = expected
+        elif expected.output is None:
+            return self._compare_digest(expected, file2)
+        else:
+            file1 = expected.output
+
+        self.logger.info('Comparing %s and %s' % (file1, file2))
+        try:
+            offset = compare_files(file1, file2)
+        except OSError as e:
+            self.logger.error(str(e))
+            return str(e)
+        if offset is not None:
+            self.logger.error('Files %s and %s differ' % (file1, file2))
+            self.logger.debug('First difference at byte %d:\n  %s: %s\n  %s: %s' % \
+                    (offset, file1, file_excerpt(file1, offset),
+                        file2, file_excerpt(file2, offset)))
+            return 'content differs at byte %d' % (offset)
+        else:
+            self.logger.info('Files %s and %s are the same' % (file1, file2))
+            return None
+
+    def _compare_digest(self, expected, file2):
+        self.logger.info('Comparing %s to content with SHA-256 %s' % \
+                (file2, expected.digest))
+        try:
+            digest, size = file_digest(file2)
+        except OSError as e:
+            self.logger.error(str(e))
+            return str(e)
+        if digest != expected.digest:
+            self.logger.error('File %s differs from the content downloaded directly' % (file2))
+            self.logger.debug('Expected %d bytes with SHA-256 %s; got %d bytes with SHA-256 %s' % \
+                    (expected.size, expected.digest, size, digest))
+            return 'content differs (%d bytes, expected %d)' % \
+                    (size, expected.size)
+        else:
+            self.logger.info('File %s is the same as the content downloaded directly' % (file2))
+            return None
+
+    def _check_request(self, url, proxy_fetch, expected, dst_path_proxy,
+            reason=None, margin=None):
+        # Compare what was fetched through the proxy to what was expected,
+        # record the outcome (see _record_request()), and return whether it
+        # was a success.  A reason given by the caller takes precedence.
+        same = self._compare(expected, dst_path_proxy)
+        returncode = proxy_fetch.poll()
+        if returncode is not None and returncode != FETCH_OK:
+            same = 'fetch through the proxy failed: %s' % \
+                    (FETCH_ERRORS.get(returncode, returncode))
+        if reason is None:
+            reason = same
+        self._record_request(url, proxy_fetch, expected, reason, margin)
+        return reason is None
+
+    def _record_request(self, url, proxy_fetch, expected, reason,
+            margin=None):
+        self.requests.append({
+                'url': url,
+                'proxy': {
+                    'latency': proxy_fetch.latency,
+                    'ttfb': proxy_fetch.ttfb,
+                    'bytes': proxy_fetch.size,
+                    'status': FETCH_ERRORS.get(proxy_fetch.poll(), 'ok'),
+                    },
+                'direct': {
+                    'latency': expected.latency,
+                    'bytes': expected.size,
+                    },
+                'success': reason is None,
+                'reason': reason,
+                # for the fast request of a pair, how long before the slow
+                # one it finished
+                'margin': margin,
+                })
+
+    def finished_before(self, fetch1, fetch2):
+        # How long before fetch2 fetch1 received the last byte of its response
+        # (negative if after), or None if either of them received nothing.
+        # Both times are taken by the fetcher, on the same monotonic clock.
+        if fetch1.last_byte_time is None or fetch2.last_byte_time is None:
+            return None
+        return fetch2.last_byte_time - fetch1.last_byte_time
+
+    def run(self):
+        raise NotImplemented
+
+
+class BasicProxyTest(ProxyTest):
+    FILES = ['foo.html', 'bar.txt', 'socket.jpg']
+    DESCRIPTION = 'Basic Proxy Test'
+    EXTENDED_DESCRIPTION = \
+            'Requesting files of several types through proxy.' 
+
+    download_proxy = ProxyTest._download_proxy
+
+    def run(self):
+        # Now do the test by fetching some text and binary files directly from
+        # Tiny and via the proxy, and then comparing the results.
+        tried = []
+        for (i, filename) in enumerate(self.FILES):
+            if filename.startswith('http://'):
+                url = filename
+                (scheme, netloc, path, params, query, fragment) = \
+                        urllib.parse.urlparse(url)
+                if query:
+                    filename = '%s?%s' % (path, query)
+                else:
+                    filename = path
+            else:
+                url = 'http://%s:%d/%s' % \
+                        (self.server_host, self.server_port, filename)
+            dst_path_proxy = os.path.join(self.proxy_dir,
+                    '%s-%d' % (self._filesystem_safe(filename), i))
+            dst_path_noproxy = os.path.join(self.noproxy_dir,
+                    '%s-%d' % (self._filesystem_safe(filename), i))
+
+            proxy_proc = self.download_proxy(url, dst_path_proxy, 10)
+            proxy_proc.wait()
+
+            noproxy_proc = self.reference(url, dst_path_noproxy, 10)
+            noproxy_proc.wait()
+
+            tried.append((url, proxy_proc, dst_path_proxy, noproxy_proc))
+
+        successes = 0
+        for (url, proxy_proc, dst_path_proxy, noproxy_proc) in tried:
+            if self._check_request(url, proxy_proc, noproxy_proc, dst_path_proxy):
+                successes += 1
+        status = {}
+
+        self.attempts = len(tried)
+        self.successes = successes
+
+class NonlocalProxyTest(BasicProxyTest):
+    FILES = ['http://www-notls.imaal.byu.edu/index.html',
+            'http://www-notls.imaal.byu.edu/images/imaal-80x80.png']
+    DESCRIPTION = 'Non-local Proxy Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing a request to the proxy ' + \
+            'for a non-local URL.'
+
+class SlowRequestProxyTest(BasicProxyTest):
+    FILES = ['foo.html']
+    DESCRIPTION = 'Slow Request Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing a request to the proxy, iteratively, using several ' + \
+            'calls to send().'
+
+    download_proxy = ProxyTest._download_proxy_slow
+
+class SlowResponseProxyTest(BasicProxyTest):
+    FILES = ['cgi-bin/slow?sleep=1&size=4096']
+    DESCRIPTION = 'Slow Response Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing a request to the proxy for a file that the server ' + \
+            'sends iteratively, over several calls to send().'
+
+class SlowRequestResponseProxyTest(BasicProxyTest):
+    FILES = ['cgi-bin/slow?sleep=1&size=4096']
+    DESCRIPTION = 'Slow Request/Response Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing a request to the proxy, iteratively, for a file that ' + \
+            'the server also sends iteratively.'
+
+    download_proxy = ProxyTest._download_proxy_slow
+
+class DumbConcurrencyProxyTest(BasicProxyTest):
+    FILES = ['foo.html']
+    DESCRIPTION = 'Dumb Concurrency Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing a request to the proxy, while it is busy with ' + \
+            'another request.' 
+
+    def __init__(self, *args, **kwargs):
+        super(DumbConcurrencyProxyTest, self).__init__(*args, **kwargs)
+        self.start_nop_server()
+
+    def run(self):
+        url = 'http://%s:%d/' % (self.nop_server_host, self.nop_server_port)
+        dst_path_proxy = os.path.join(self.proxy_dir, 'nop-server-request')
+        nop_proc = self.download_proxy(url, dst_path_proxy, 10)
+        # the proxy is only busy once it is stuck waiting on nop-server
+        self.wait_for_nop_connections(1, 5)
+
+        return super(DumbConcurrencyProxyTest, self).run()
+
+class CacheTest(ProxyTest):
+    FILES = ['foo.html', 'bar.txt']
+    DESCRIPTION = 'Cache Test'
+    EXTENDED_DESCRIPTION = \
+            'Requesting a file through the proxy after it has already ' + \
+            'been requested.'
+
+    download_proxy = ProxyTest._download_proxy
+
+    def run(self):
+        # Now do the test by fetching some text and binary files directly from
+        # Tiny and via the proxy, and then comparing the results.
+        tried = []
+        noproxy_procs = []
+        for (i, filename) in enumerate(self.FILES):
+            dst_path_proxy = os.path.join(self.proxy_dir,
+                    '%s-%d' % (self._filesystem_safe(filename), i))
+            dst_path_noproxy = os.path.join(self.noproxy_dir,
+                    '%s-%d' % (self._filesystem_safe(filename), i))
+            url = 'http://%s:%d/%s' % \
+                    (self.server_host, self.server_port, filename)
+
+            proxy_proc = self.download_proxy(url, dst_path_proxy, 10)
+            proxy_proc.wait()
+
+            noproxy_proc = self.reference(url, dst_path_noproxy, 10)
+            noproxy_proc.wait()
+            noproxy_procs.append(noproxy_proc)
+
+        self.kill_server()
+
+        for (i, filename) in enumerate(self.FILES):
+            dst_path_proxy = os.path.join(self.proxy_dir,
+                    '%s-%d' % (self._filesystem_safe(filename), i))
+
+            try:
+                os.unlink(dst_path_proxy)
+            except OSError as e:
+                self.logger.warning('Error removing downloaded file "%s": %s' % \
+                        (dst_path_proxy, str(e)))
+
+            url = 'http://%s:%d/%s' % (self.server_host, self.server_port, filename)
+
+            proxy_proc = self.download_proxy(url, dst_path_proxy, 10)
+            proxy_proc.wait()
+
+            tried.append((url, proxy_proc, dst_path_proxy, noproxy_procs[i]))
+
+        successes = 0
+        for (url, proxy_proc, dst_path_proxy, noproxy_proc) in tried:
+            if self._check_request(url, proxy_proc, noproxy_proc, dst_path_proxy):
+                successes += 1
+        status = {}
+
+        self.attempts = len(tried)
+        self.successes = successes
+
+class GenericConcurrencyProxyTest(ProxyTest):
+    FILES = ['cgi-bin/slow?sleep=1&size=4096', 'foo.html']
+    SLOW_FILE = 'cgi-bin/slow?sleep=1&size=4096'
+    FAST_FILE = 'foo.html'
+    DESCRIPTION = 'Extended Concurrency Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing 5 fast requests to the proxy, while it is busy ' + \
+            'handling 5 slow requests that were issued first.'
+
+    TIMES_TO_RUN = None
+    TIMEOUT = 10
+
+    download_proxy = ProxyTest._download_proxy
+    download_proxy_slow = ProxyTest._download_proxy_slow
+
+    def run(self):
+
+        # Now do the test by fetching some text and binary files directly from
+        # Tiny and via the proxy, and then comparing the results.
+        tried_slow = []
+        start_time = time.monotonic()
+        i = 0
+        for i in range(i, self.TIMES_TO_RUN):
+            dst_path_proxy = os.path.join(self.proxy_dir,
+                    '%s-%d' % (self._filesystem_safe(self.SLOW_FILE), i))
+            dst_path_noproxy = os.path.join(self.noproxy_dir,
+                    '%s-%d' % (self._filesystem_safe(self.SLOW_FILE), i))
+            url = 'http://%s:%d/%s&i=%d' % \
+                    (self.server_host, self.server_port, self.SLOW_FILE, i)
+
+            proxy_proc = self.download_proxy_slow(url, dst_path_proxy, self.TIMEOUT)
+            noproxy_proc = self.reference(url, dst_path_noproxy, self.TIMEOUT)
+
+            tried_slow.append((url, proxy_proc, noproxy_proc, dst_path_proxy, dst_path_noproxy))
+
+        # Wait for all the slow requests through the proxy to have reached
+        # the server, and for the proxy to have settled on the threads or
+        # processes handling them.
+        self.wait_for_server_requests('/%s&i=' % (self.SLOW_FILE),
+                self.TIMES_TO_RUN, 3)
+        self.wait_for_proxy_tasks(1)
+        self.sampler.sample()
+
+        tried = []
+        for i in range(self.TIMES_TO_RUN, self.TIMES_TO_RUN * 2):
+            dst_path_proxy = os.path.join(self.proxy_dir,
+                    '%s-%d' % (self._filesystem_safe(self.FAST_FILE), i))
+            dst_path_noproxy = os.path.join(self.noproxy_dir,
+                    '%s-%d' % (self._filesystem_safe(self.FAST_FILE), i))
+            url = 'http://%s:%d/%s?i=%d' % \
+                    (self.server_host, self.server_port, self.FAST_FILE, i)
+
+            proxy_proc = self.download_proxy(url, dst_path_proxy, self.TIMEOUT)
+            noproxy_proc = self.reference(url, dst_path_noproxy, self.TIMEOUT)
+
+            tried.append((url, proxy_proc, noproxy_proc, dst_path_proxy, dst_path_noproxy))
+
+        for (url, proxy_proc, noproxy_proc, dst_path_proxy, dst_path_noproxy) in \
+                tried + tried_slow:
+            proxy_proc.wait()
+            noproxy_proc.wait()
+
+        # the most threads and processes used while handling the requests
+        self.num_processes_realtime = self.sampler.max('processes', start_time)
+        self.num_threads_realtime = self.sampler.max('threads', start_time)
+        self.probe_connections = self.TIMES_TO_RUN
+
+        successes = 0
+        for i in range(self.TIMES_TO_RUN):
+            (url_s, proxy_proc_s, noproxy_proc_s, dst_path_proxy_s, dst_path_noproxy_s) = tried_slow[i]
+            (url, proxy_proc, noproxy_proc, dst_path_proxy, dst_path_noproxy) = tried[i]
+            margin = self.finished_before(proxy_proc, proxy_proc_s)
+            fast_before_slow = margin is not None and margin > CONCURRENCY_SLACK
+            if fast_before_slow:
+                self.logger.info('%s was received %.3fs before %s' % \
+                        (url, margin, url_s))
+                reason = None
+            elif margin is None:
+                self.logger.error('Unable to tell whether %s was received before %s' % \
+                        (url, url_s))
+                reason = 'not received, or the slow request %s was not' % (url_s)
+            else:
+                self.logger.error('%s should have been received before %s (%.3fs before; at least %.3fs needed)' % \
+                        (url, url_s, margin, CONCURRENCY_SLACK))
+                reason = 'received %.3fs before the slow request %s; at least %.3fs needed' % \
+                        (margin, url_s, CONCURRENCY_SLACK)
+            same_s = self._check_request(url_s, proxy_proc_s, noproxy_proc_s,
+                    dst_path_proxy_s)
+            same = self._check_request(url, proxy_proc, noproxy_proc,
+                    dst_path_proxy, reason, margin)
+            if same_s and same and fast_before_slow:
+                successes += 1
+
+        self.attempts = self.TIMES_TO_RUN
+        self.successes = successes
+
+class BasicConcurrencyProxyTest(GenericConcurrencyProxyTest):
+    DESCRIPTION = 'Basic Concurrency Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing 1 fast request to the proxy, while it is busy ' + \
+            'handling 1 slow request that was issued first.'
+
+    TIMES_TO_RUN = 1
+
+class ExtendedConcurrencyProxyTest(GenericConcurrencyProxyTest):
+    DESCRIPTION = 'Extended Concurrency Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing 5 fast requests to the proxy, while it is busy ' + \
+            'handling 5 slow requests that were issued first.'
+
+    TIMES_TO_RUN = 5
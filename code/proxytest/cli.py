@@ -0,0 +1,264 @@
+# proxytest/cli.py - The command-line interface of the proxy test driver.
+#
+# Only what is needed to parse the command line is imported up front; the
+# tests themselves are imported once the arguments have been parsed.
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from .config import BENCH_MIX, CACHE_MAX_OBJECT_SIZE, CACHE_MAX_SIZE, \
+        CACHE_SIZES
+from .errors import MissingDirectory
+
+def _bench_url(s):
+    # <file>[@<weight>]
+    try:
+        f, weight = s.rsplit('@', 1)
+    except ValueError:
+        return (s, 1)
+    try:
+        return (f, float(weight))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid weight: %s' % (weight))
+
+def _scale_steps(s):
+    # <num>[,<num>...]
+    try:
+        steps = tuple([int(n) for n in s.split(',')])
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid steps: %s' % (s))
+    if not steps or min(steps) < 1:
+        raise argparse.ArgumentTypeError('invalid steps: %s' % (s))
+    return steps
+
+def _cache_sizes(s):
+    # <bytes>[@<weight>][,<bytes>[@<weight>]...]
+    sizes = []
+    for item in s.split(','):
+        try:
+            size, weight = item.split('@', 1)
+        except ValueError:
+            size, weight = item, '1'
+        try:
+            sizes.append((int(size), float(weight)))
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid sizes: %s' % (s))
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', type=str, action='store',
+            choices=('multiprocess', 'processpool', 'multithread', 'threadpool', 'epoll'))
+    parser.add_argument('-b', '--check-basic', type=int, action='store', metavar='<points>',
+            help='Check proxy with basic HTTP tests')
+    parser.add_argument('-c', '--check-concurrency', type=int, action='store', metavar='<points>',
+            help='Check proxy for concurrent tests')
+    parser.add_argument('-m', '--check-memory-mgmt', type=int, action='store', metavar='<points>',
+            help='Check that proxy frees memory properly')
+    parser.add_argument('-s', '--check-clean-shutdown', type=int, action='store', metavar='<points>',
+            help='Check that proxy frees memory properly on shutdown')
+    parser.add_argument('-e', '--check-cache', type=int, action='store', metavar='<points>',
+            help='Check that proxy caches properly')
+    #parser.add_argument('-l', '--check-logging', type=int, action='store', metavar='<points>',
+    #        help='Check that proxy logs properly')
+    parser.add_argument('-p', '--proxy-output', type=argparse.FileType('wb'),
+            action='store', metavar='<file>',
+            help='Send proxy-output to a file (Use "-" for stdout).')
+    parser.add_argument('-t', '--server-output', type=argparse.FileType('wb'),
+            action='store', metavar='<file>',
+            help='Send server output to a file (Use "-" for stdout).')
+    parser.add_argument('-k', '--keep-files', action='store_const', const=True, default=False,
+            help='Don\'t delete files used for proxy/no-proxy downloads.')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+            help='Use more verbose output for debugging (use multiple times for more verbosity).')
+    parser.add_argument('-j', '--jobs', type=int, action='store', default=1, metavar='<num>',
+            help='Run up to <num> test classes at the same time (default: 1).')
+    parser.add_argument('--sample-interval', type=float, action='store', default=0.1, metavar='<seconds>',
+            help='Sample the threads, processes, file descriptors, memory and CPU time of the proxy every <seconds> seconds (default: 0.1).')
+    parser.add_argument('--samples-dir', type=str, action='store', metavar='<dir>',
+            help='Save the samples for each test, as CSV, in <dir>.')
+    parser.add_argument('--trace-epoll', action='store_const', const=True, default=False,
+            help='Run the proxy under strace to count the events handled by each call to epoll_wait() (epoll mode only; not with memcheck).')
+    parser.add_argument('--origin', type=str, action='store', metavar='<server>',
+            choices=('http.server', 'stand-in'),
+            help='Use Python\'s http.server, or the stand-in in origin.py, which handles many more concurrent requests, as the origin server (default: the stand-in with --bench, --scale and --cache-bench, http.server otherwise).')
+    parser.add_argument('--mem-check', type=str, action='store', metavar='<checker>',
+            choices=('memcheck', 'asan', 'none'),
+            help='Check memory management with valgrind\'s memcheck (the default with -m or -s), with the AddressSanitizer build of the proxy ("make proxy-asan"; -m only), or not at all (the default otherwise).')
+    parser.add_argument('--valgrind-xml', action='store_const', const=True, default=False,
+            help='Have valgrind write its output as XML, rather than text, for -m and -s.')
+    parser.add_argument('-o', '--results', type=argparse.FileType('w'),
+            action='store', metavar='<file>',
+            help='Also write the results of each test, as it finishes, to a file (Use "-" for stdout).')
+    parser.add_argument('--results-format', type=str, action='store', default='jsonl',
+            choices=('jsonl', 'junit'),
+            help='Write the results as JSON Lines or as JUnit XML (default: jsonl).')
+    parser.add_argument('--bench', action='store_const', const=True, default=False,
+            help='Instead of checking the proxy, put it under load and report throughput and latency as JSON.')
+    parser.add_argument('--bench-url', type=_bench_url, action='append', metavar='<file>[@<weight>]',
+            help='Add a file (relative to the www directory) to the request mix of the benchmark, optionally with a weight (default: %s).' % \
+                    ', '.join(['%s@%d' % (f, w) for (f, w) in BENCH_MIX]))
+    parser.add_argument('--bench-duration', type=float, action='store', default=10, metavar='<seconds>',
+            help='Run the benchmark for <seconds> seconds (default: 10).')
+    parser.add_argument('--bench-concurrency', type=int, action='store', default=10, metavar='<num>',
+            help='Keep <num> requests in flight during the benchmark (default: 10).')
+    parser.add_argument('--bench-rate', type=float, action='store', metavar='<num>',
+            help='Issue <num> requests per second during the benchmark, instead of using a fixed concurrency.')
+    parser.add_argument('--bench-output', type=argparse.FileType('w'), action='store', default=sys.stdout, metavar='<file>',
+            help='Write the benchmark (or scale-out, or cache benchmark) results to a file (default: stdout).')
+    parser.add_argument('--scale', action='store_const', const=True, default=False,
+            help='Instead of checking the proxy, issue more and more pairs of slow and fast requests to it, and report, as JSON, how well it keeps up.')
+    parser.add_argument('--scale-steps', type=_scale_steps, action='store', metavar='<num>[,<num>...]',
+            help='Issue this many pairs of requests at each step of the scale-out test (default: 10,50,200,1000).')
+    parser.add_argument('--cache-bench', action='store_const', const=True, default=False,
+            help='Instead of checking the proxy, replay a stream of requests for objects of different popularity, and report its hit ratio, the latency of hits and misses, and whether it respects its size limits, as JSON.')
+    parser.add_argument('--cache-objects', type=int, action='store', default=200, metavar='<num>',
+            help='Request <num> different objects in the cache benchmark (default: 200).')
+    parser.add_argument('--cache-requests', type=int, action='store', default=2000, metavar='<num>',
+            help='Issue <num> requests in the cache benchmark (default: 2000).')
+    parser.add_argument('--cache-zipf', type=float, action='store', default=1.0, metavar='<s>',
+            help='Make the popularity of objects follow a Zipf distribution with exponent <s> (default: 1.0).')
+    parser.add_argument('--cache-sizes', type=_cache_sizes, action='store', metavar='<bytes>[@<weight>][,...]',
+            help='Draw the size of each object from these sizes, optionally weighted (default: %s).' % \
+                    ','.join(['%d@%d' % (size, w) for (size, w) in CACHE_SIZES]))
+    parser.add_argument('--cache-concurrency', type=int, action='store', default=1, metavar='<num>',
+            help='Keep <num> requests in flight during the cache benchmark (default: 1).')
+    parser.add_argument('--cache-max-size', type=int, action='store', default=CACHE_MAX_SIZE, metavar='<bytes>',
+            help='Check that the proxy caches no more than <bytes> bytes at once (default: %d).' % (CACHE_MAX_SIZE))
+    parser.add_argument('--cache-max-object-size', type=int, action='store', default=CACHE_MAX_OBJECT_SIZE, metavar='<bytes>',
+            help='Check that the proxy does not cache objects of more than <bytes> bytes (default: %d).' % (CACHE_MAX_OBJECT_SIZE))
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if len([a for a in (args.bench, args.scale, args.cache_bench) if a]) > 1:
+        parser.error('--bench, --scale and --cache-bench cannot be used together')
+    if args.cache_objects < 1 or args.cache_requests < 1 or args.cache_concurrency < 1:
+        parser.error('--cache-objects, --cache-requests and --cache-concurrency must be at least 1')
+    if args.trace_epoll and args.mode != 'epoll':
+        parser.error('--trace-epoll can only be used with epoll mode')
+    if args.origin is None:
+        if args.bench or args.scale or args.cache_bench:
+            args.origin = 'stand-in'
+        else:
+            args.origin = 'http.server'
+    if args.mem_check is None:
+        if args.check_memory_mgmt is not None or args.check_clean_shutdown is not None:
+            args.mem_check = 'memcheck'
+        else:
+            args.mem_check = 'none'
+    if args.mem_check == 'none' and \
+            (args.check_memory_mgmt is not None or args.check_clean_shutdown is not None):
+        parser.error('-m and -s need a memory checker')
+    if args.mem_check == 'asan' and args.check_clean_shutdown is not None:
+        parser.error('-s needs memcheck; AddressSanitizer does not report memory still reachable at exit')
+    if args.trace_epoll and args.mem_check == 'memcheck':
+        parser.error('--trace-epoll cannot be used with memcheck')
+    if args.mem_check == 'none':
+        args.mem_check = None
+    if args.samples_dir is not None and not os.path.isdir(args.samples_dir):
+        raise MissingDirectory('Directory "%s" not found' % (args.samples_dir))
+
+    if args.verbose > 1:
+        level = logging.DEBUG
+    elif args.verbose == 1:
+        level = logging.INFO
+    else:
+        level = logging.WARNING
+    if args.jobs > 1:
+        fmt = '%(levelname)s: [%(threadName)s] %(message)s'
+    else:
+        fmt = '%(levelname)s: %(message)s'
+    logging.basicConfig(level=level, format=fmt)
+
+    if args.bench or args.scale or args.cache_bench:
+        if args.bench:
+            from .bench import ProxyBenchmark
+
+            cls = ProxyBenchmark
+            kwargs = dict(mix=args.bench_url,
+                    duration=args.bench_duration,
+                    concurrency=args.bench_concurrency,
+                    rate=args.bench_rate)
+        elif args.scale:
+            from .scaling import ScaleOutConcurrencyProxyTest
+
+            cls = ScaleOutConcurrencyProxyTest
+            kwargs = dict(steps=args.scale_steps)
+        else:
+            from .cachebench import CacheBenchmark
+
+            cls = CacheBenchmark
+            kwargs = dict(objects=args.cache_objects,
+                    requests=args.cache_requests,
+                    zipf=args.cache_zipf,
+                    sizes=args.cache_sizes,
+                    concurrency=args.cache_concurrency,
+                    max_size=args.cache_max_size,
+                    max_object_size=args.cache_max_object_size)
+
+        p = cls(mode=args.mode,
+                origin=args.origin,
+                trace_epoll=args.trace_epoll,
+                mem_check=args.mem_check,
+                sample_interval=args.sample_interval,
+                keep_files=args.keep_files,
+                server_output=args.server_output,
+                proxy_output=args.proxy_output,
+                verbose=args.verbose,
+                **kwargs)
+        p.run()
+        p.cleanup()
+        json.dump(p.report, args.bench_output, indent=2)
+        args.bench_output.write('\n')
+        return
+
+    from .cases import BasicProxyTest, NonlocalProxyTest, \
+            SlowRequestProxyTest, SlowResponseProxyTest, \
+            SlowRequestResponseProxyTest, CacheTest, \
+            BasicConcurrencyProxyTest, ExtendedConcurrencyProxyTest
+    from .results import RESULTS_WRITERS
+    from .suite import ProxyTestSuite
+
+    classes = []
+    if args.check_basic is not None:
+        classes.append((
+            (BasicProxyTest,
+                NonlocalProxyTest,
+                SlowRequestProxyTest,
+                SlowResponseProxyTest,
+                SlowRequestResponseProxyTest),
+            args.check_basic))
+    if args.check_cache is not None:
+        classes.append((
+            (CacheTest, ),
+            args.check_cache))
+    if args.check_concurrency is not None:
+        classes.append((
+            (BasicConcurrencyProxyTest,
+                ExtendedConcurrencyProxyTest),
+            args.check_concurrency))
+
+    results = None
+    if args.results is not None:
+        results = RESULTS_WRITERS[args.results_format](args.results)
+
+    p = ProxyTestSuite(args.mode, classes,
+            mem_mgmt=args.check_memory_mgmt,
+            clean_shutdown=args.check_clean_shutdown,
+            keep_files=args.keep_files,
+            server_output=args.server_output,
+            proxy_output=args.proxy_output,
+            verbose=args.verbose,
+            jobs=args.jobs,
+            sample_interval=args.sample_interval,
+            samples_dir=args.samples_dir,
+            trace_epoll=args.trace_epoll,
+            mem_check=args.mem_check,
+            valgrind_xml=args.valgrind_xml,
+            results=results,
+            origin=args.origin)
+    p.run()
@@ -0,0 +1,55 @@
+# proxytest/compare.py - Comparing downloaded content.
+
+import hashlib
+
+COMPARE_CHUNK_SIZE = 65536
+EXCERPT_SIZE = 32
+
+def file_digest(filename):
+    h = hashlib.sha256()
+    size = 0
+    buf = bytearray(COMPARE_CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(filename, 'rb', buffering=0) as fh:
+        while True:
+            n = fh.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            size += n
+    return h.hexdigest(), size
+
+def compare_files(file1, file2):
+    # Compare the contents of two files, a chunk at a time.  Return None if
+    # they are the same, or the offset of the first byte that differs
+    # (including the offset at which the shorter of the two ends).
+    offset = 0
+    with open(file1, 'rb') as fh1, open(file2, 'rb') as fh2:
+        while True:
+            buf1 = fh1.read(COMPARE_CHUNK_SIZE)
+            buf2 = fh2.read(COMPARE_CHUNK_SIZE)
+            if buf1 != buf2:
+                for i, (b1, b2) in enumerate(zip(buf1, buf2)):
+                    if b1 != b2:
+                        return offset + i
+                return offset + min(len(buf1), len(buf2))
+            if not buf1:
+                return None
+            offset += len(buf1)
+
+def file_excerpt(filename, offset, size=EXCERPT_SIZE):
+    # Return a printable excerpt of at most size bytes of a file, starting at
+    # offset: as text, if it is printable, or as hex otherwise.
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        buf = fh.read(size)
+    if not buf:
+        return '<EOF>'
+    try:
+        text = buf.decode('ascii')
+    except UnicodeDecodeError:
+        pass
+    else:
+        if all(c.isprintable() or c in '\r\n\t' for c in text):
+            return repr(text)
+    return buf.hex(' ')
@@ -0,0 +1,41 @@
+# proxytest/config.py - Paths and settings shared by the proxy test driver.
+#
+# Paths are relative to the current directory, which is the lab directory
+# from which the driver is run.
+
+import os
+
+CURRENT_DIR = '.'
+SLOW_CLIENT = os.path.join(CURRENT_DIR, 'slow-client.py')
+NOP_SERVER = os.path.join(CURRENT_DIR, 'nop-server.py')
+PROXY = os.path.join(CURRENT_DIR, 'proxy')
+# the proxy built with AddressSanitizer ("make proxy-asan")
+PROXY_ASAN = os.path.join(CURRENT_DIR, 'proxy-asan')
+WWW_DIR = os.path.join(CURRENT_DIR, 'www')
+VALGRIND = 'valgrind'
+STRACE = 'strace'
+# the stand-in for the origin server, which is not in the lab directory but
+# in this package
+ORIGIN_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'origin.py')
+
+# how long (seconds) before the slow request of a pair the fast one must have
+# finished for the proxy to be deemed to handle them concurrently; a proxy
+# that handles them one after the other finishes the fast one after the slow
+# one, but both may be seen at about the same time by the driver
+CONCURRENCY_SLACK = 0.05
+
+# the number of allocation sites of leaked memory that are logged
+LEAK_SITES = 10
+
+# (file, weight) pairs requested by the benchmark by default
+BENCH_MIX = [('foo.html', 5), ('socket.jpg', 3),
+        ('cgi-bin/slow?sleep=0&size=4096', 2)]
+
+# the limits of the cache that the cache benchmark checks by default; those
+# recommended in proxy.c
+CACHE_MAX_SIZE = 1049000
+CACHE_MAX_OBJECT_SIZE = 102400
+# (size, weight) pairs of the objects requested by the cache benchmark by
+# default; the largest are too big to be cached
+CACHE_SIZES = [(1024, 4), (8192, 3), (32768, 2), (153600, 1)]
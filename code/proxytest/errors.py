@@ -0,0 +1,13 @@
+# proxytest/errors.py - Exceptions raised by the proxy test driver.
+
+class PortWaitTimeout(Exception):
+    pass
+
+class MissingFile(Exception):
+    pass
+
+class MissingDirectory(Exception):
+    pass
+
+class FailedCommand(Exception):
+    pass
@@ -0,0 +1,219 @@
+# proxytest/fetch.py - An HTTP client that runs in the driver itself.
+
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import threading
+import time
+import urllib.parse
+
+# Exit statuses of a fetch; the same values that curl uses
+FETCH_OK = 0
+FETCH_COULDNT_CONNECT = 7
+FETCH_TIMEOUT = 28
+FETCH_EMPTY_REPLY = 52
+FETCH_RECV_ERROR = 56
+FETCH_ERRORS = {
+        FETCH_COULDNT_CONNECT: 'connect',
+        FETCH_TIMEOUT: 'timeout',
+        FETCH_EMPTY_REPLY: 'empty_reply',
+        FETCH_RECV_ERROR: 'recv_error',
+        }
+
+def _split_netloc(netloc, default_port):
+    try:
+        host, port = netloc.rsplit(':', 1)
+    except ValueError:
+        return netloc, default_port
+    else:
+        return host, int(port)
+
+# A fetch that was started by HTTPFetcher.  Like a subprocess.Popen object for
+# curl, wait() returns the exit status, and poll() returns None until then.
+# The SHA-256 digest and size of the body are available once it is done, so
+# the body only needs to be written to a file if output is specified.
+class Fetch:
+    def __init__(self, output):
+        self.output = output
+        self.future = None
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        # time.monotonic() values for the start and end of the fetch, and for
+        # when the request started to be sent, when the first byte of the
+        # response was received, and when the last one was
+        self.start_time = None
+        self.end_time = None
+        self.send_time = None
+        self.first_byte_time = None
+        self.last_byte_time = None
+
+    @property
+    def digest(self):
+        return self.sha256.hexdigest()
+
+    @property
+    def latency(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    @property
+    def ttfb(self):
+        # the time from sending the request to the first byte of the response
+        if self.send_time is None or self.first_byte_time is None:
+            return None
+        return self.first_byte_time - self.send_time
+
+    @property
+    def returncode(self):
+        return self.poll()
+
+    def poll(self):
+        if not self.future.done():
+            return None
+        return self.future.result()
+
+    def wait(self):
+        return self.future.result()
+
+# An HTTP/1.0 client that runs in the driver itself.  All fetches are run by a
+# single asyncio event loop, in a background thread, so that any number of them
+# can be in flight at the same time without starting any processes.
+class HTTPFetcher:
+    BUFSIZE = 65536
+
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('.')
+
+    def _get_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                t = threading.Thread(target=self.loop.run_forever,
+                        name='fetcher', daemon=True)
+                t.start()
+        return self.loop
+
+    def fetch(self, url, output, timeout, proxy=None, sleep_between_send=0):
+        f = Fetch(output)
+        coro = self._fetch(f, url, timeout, proxy, sleep_between_send)
+        f.future = asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+        return f
+
+    async def fetch_async(self, url, output, timeout, proxy=None,
+            sleep_between_send=0):
+        # Like fetch(), but called from (and run in) the fetcher's event loop;
+        # return the Fetch when it is done.
+        f = Fetch(output)
+        f.future = concurrent.futures.Future()
+        f.future.set_result(
+                await self._fetch(f, url, timeout, proxy, sleep_between_send))
+        return f
+
+    def run(self, coro):
+        # run a coroutine in the fetcher's event loop and return its result
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    async def _fetch(self, f, url, timeout, proxy, sleep_between_send):
+        f.start_time = time.monotonic()
+        try:
+            return await self._fetch_with_timeout(f, url, timeout, proxy,
+                    sleep_between_send)
+        finally:
+            f.end_time = time.monotonic()
+
+    async def _fetch_with_timeout(self, f, url, timeout, proxy,
+            sleep_between_send):
+        try:
+            return await asyncio.wait_for(
+                    self._do_fetch(f, url, proxy, sleep_between_send),
+                    timeout)
+        except asyncio.TimeoutError:
+            self.logger.debug('Timed out fetching %s' % (url))
+            return FETCH_TIMEOUT
+        except OSError as e:
+            # failures to connect are handled by _do_fetch(), so this is,
+            # e.g., a connection reset once it was up
+            self.logger.debug('Error fetching %s: %s' % (url, str(e)))
+            return FETCH_RECV_ERROR
+        except Exception as e:
+            # a fetch that fails is a failed request, not a failed test run
+            self.logger.warning('Unexpected error fetching %s: %s: %s' % \
+                    (url, type(e).__name__, str(e)))
+            return FETCH_RECV_ERROR
+
+    async def _do_fetch(self, f, url, proxy, sleep_between_send):
+        (scheme, netloc, path, params, query, fragment) = \
+                urllib.parse.urlparse(url)
+        if proxy is not None:
+            host, port = _split_netloc(urllib.parse.urlparse(proxy).netloc, 8080)
+            uri = url
+        else:
+            host, port = _split_netloc(netloc, 80)
+            if not path:
+                path = '/'
+            if query:
+                uri = '%s?%s' % (path, query)
+            else:
+                uri = path
+
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            # including ConnectionRefusedError, as with curl
+            self.logger.debug('Error connecting to %s:%d: %s' % \
+                    (host, port, str(e)))
+            return FETCH_COULDNT_CONNECT
+        try:
+            request_line = bytes('GET %s HTTP/1.0\r\n' % (uri), 'utf-8')
+            headers = bytes('Host: %s\r\n\r\n' % (netloc), 'utf-8')
+            if sleep_between_send:
+                # send the request in two pieces, like slow-client.py
+                await asyncio.sleep(sleep_between_send)
+                f.send_time = time.monotonic()
+                writer.write(request_line)
+                await writer.drain()
+                await asyncio.sleep(sleep_between_send)
+                writer.write(headers)
+            else:
+                f.send_time = time.monotonic()
+                writer.write(request_line + headers)
+            await writer.drain()
+
+            # the first byte is read by itself, to know when it arrived
+            if not await reader.read(1):
+                return FETCH_EMPTY_REPLY
+            f.first_byte_time = f.last_byte_time = time.monotonic()
+            try:
+                await reader.readuntil(b'\r\n\r\n')
+            except asyncio.IncompleteReadError:
+                return FETCH_EMPTY_REPLY
+            except (asyncio.LimitOverrunError, ValueError) as e:
+                # no end of the headers within the limit of the stream
+                self.logger.debug('Error reading headers from %s: %s' % \
+                        (url, str(e)))
+                return FETCH_RECV_ERROR
+            f.last_byte_time = time.monotonic()
+
+            fh = None
+            if f.output is not None:
+                fh = open(f.output, 'wb')
+            try:
+                while True:
+                    buf = await reader.read(self.BUFSIZE)
+                    if not buf:
+                        break
+                    f.last_byte_time = time.monotonic()
+                    f.sha256.update(buf)
+                    f.size += len(buf)
+                    if fh is not None:
+                        fh.write(buf)
+            finally:
+                if fh is not None:
+                    fh.close()
+        finally:
+            writer.close()
+        return FETCH_OK
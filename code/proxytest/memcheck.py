@@ -0,0 +1,119 @@
+# proxytest/memcheck.py - Checking how the proxy manages memory.
+#
+# A memory checker runs the proxy in a way that lets leaks be found, and, once
+# the proxy has exited, returns a LeakParser with what it reported.  Checkers
+# are looked up by name in MEMORY_CHECKERS.  valgrind's memcheck works with any
+# build of the proxy but slows it down considerably; AddressSanitizer needs a
+# separate build (see PROXY_ASAN), which runs at close to native speed.
+
+import os
+import subprocess
+
+from .config import PROXY, PROXY_ASAN, VALGRIND
+from .errors import FailedCommand, MissingFile
+from .sanitizer import SanitizerLeakParser, sanitizer_logs
+from .valgrind import TextLeakParser, ValgrindLogTailer, XMLLeakParser
+
+class MemoryChecker:
+    NAME = None
+    PROXY = PROXY
+    # whether memory still reachable at exit is reported
+    REPORTS_REACHABLE = False
+
+    def __init__(self, log_file, interval=0.1):
+        self.log_file = log_file
+        self.interval = interval
+
+    def check_installed(self):
+        pass
+
+    def command(self, cmd):
+        return cmd
+
+    def env(self):
+        # the environment of the proxy, or None to inherit ours
+        return None
+
+    def start(self):
+        pass
+
+    def finish(self, returncode):
+        # Return the parser, once the proxy has exited with returncode, or None
+        # if no leak check was done.  Whatever it returns, a proxy that was
+        # killed by a signal fails the checks (see ProxyTest.check_memory()).
+        raise NotImplementedError
+
+    def log_files(self):
+        return [self.log_file]
+
+class ValgrindChecker(MemoryChecker):
+    NAME = 'memcheck'
+    REPORTS_REACHABLE = True
+
+    def __init__(self, log_file, interval=0.1, xml=False):
+        super(ValgrindChecker, self).__init__(log_file, interval)
+        self.xml = xml
+        if self.xml:
+            parser = XMLLeakParser()
+        else:
+            parser = TextLeakParser()
+        self.tailer = ValgrindLogTailer(self.log_file, parser, self.interval)
+
+    def check_installed(self):
+        if subprocess.call([VALGRIND, '-h'], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT) != 0:
+            raise FailedCommand('Unable to run valgrind.  Is it installed and in PATH?')
+
+    def command(self, cmd):
+        if self.xml:
+            log_args = ['--xml=yes', '--xml-file=%s' % (self.log_file),
+                    '--log-file=/dev/null']
+        else:
+            log_args = ['--log-file=%s' % (self.log_file), '-v']
+        return [VALGRIND] + log_args + ['--leak-check=full',
+                '--show-leak-kinds=all'] + cmd
+
+    def start(self):
+        self.tailer.start()
+
+    def finish(self, returncode):
+        # memcheck reports leaks however the proxy exits
+        return self.tailer.finish()
+
+class SanitizerChecker(MemoryChecker):
+    NAME = 'asan'
+    PROXY = PROXY_ASAN
+
+    def check_installed(self):
+        if not os.path.exists(self.PROXY):
+            raise MissingFile('File "%s" not found; build it with "make proxy-asan"' % \
+                    (self.PROXY))
+
+    def env(self):
+        env = dict(os.environ)
+        options = 'log_path=%s' % (self.log_file)
+        env['ASAN_OPTIONS'] = ':'.join([o for o in
+                (os.environ.get('ASAN_OPTIONS'), 'detect_leaks=1', options) if o])
+        env['LSAN_OPTIONS'] = ':'.join([o for o in
+                (os.environ.get('LSAN_OPTIONS'), options) if o])
+        return env
+
+    def finish(self, returncode):
+        # LeakSanitizer only checks for leaks if the proxy exits, rather than
+        # being killed by a signal
+        if returncode is None or returncode < 0:
+            return None
+        parser = SanitizerLeakParser()
+        for filename in sanitizer_logs(self.log_file):
+            with open(filename, 'r', errors='replace') as fh:
+                for line in fh:
+                    parser.feed_line(line.rstrip('\n'))
+            parser.close()
+        return parser
+
+    def log_files(self):
+        return [self.log_file] + sanitizer_logs(self.log_file)
+
+MEMORY_CHECKERS = {
+        'memcheck': ValgrindChecker,
+        'asan': SanitizerChecker,
+        }
@@ -0,0 +1,146 @@
+# proxytest/nopserver.py - A server that accepts connections and never
+#                          answers, so that whoever connects to it (i.e., the
+#                          proxy) is stuck waiting for a response.
+#
+# usage: nop-server.py [-t <bytes>] [-i <seconds>] [-r <seconds>]
+#                      [-s <seconds>] <port>
+#
+# Every connection is held open, on a single asyncio event loop, until the
+# client closes it.  Whatever the client sends is read and discarded.  With -t,
+# a few bytes of a response that never ends are sent every so often; with -r,
+# connections are reset after a while.  The number of connections held is
+# printed, as "holding <n> connections", whenever it changes (at most every -s
+# seconds), and when SIGUSR1 is received.
+
+import argparse
+import asyncio
+import re
+import resource
+import signal
+import socket
+import struct
+import sys
+
+BACKLOG = 4096
+REPORT_FORMAT = 'holding %d connections'
+REPORT_RE = re.compile(r'^holding (\d+) connections$')
+# a response that never ends, for trickling
+TRICKLE_HEADERS = b'HTTP/1.0 200 OK\r\nContent-type: text/plain\r\n\r\n'
+TRICKLE_BODY = b'0123456789'
+
+def _raise_fd_limit():
+    # hold as many connections as allowed
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+class NopServer:
+    def __init__(self, trickle_bytes=0, trickle_interval=1, reset_after=None,
+            report_interval=1):
+        self.trickle_bytes = trickle_bytes
+        self.trickle_interval = trickle_interval
+        self.reset_after = reset_after
+        self.report_interval = report_interval
+        self.connections = 0
+        self.reported = None
+
+    def report(self):
+        print(REPORT_FORMAT % (self.connections))
+        sys.stdout.flush()
+        self.reported = self.connections
+
+    async def _report_changes(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            if self.connections != self.reported:
+                self.report()
+
+    async def _discard(self, reader):
+        while await reader.read(65536):
+            pass
+
+    def _trickle_data(self, offset):
+        # the next trickle_bytes bytes of the response, from offset
+        data = TRICKLE_HEADERS[offset:offset + self.trickle_bytes]
+        while len(data) < self.trickle_bytes:
+            i = (offset + len(data) - len(TRICKLE_HEADERS)) % len(TRICKLE_BODY)
+            data += TRICKLE_BODY[i:i + self.trickle_bytes - len(data)]
+        return data
+
+    def _reset(self, writer):
+        # closing with a linger time of zero sends a RST rather than a FIN
+        sock = writer.get_extra_info('socket')
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                struct.pack('ii', 1, 0))
+        writer.transport.abort()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self.connections += 1
+        read_task = asyncio.ensure_future(self._discard(reader))
+        deadline = None
+        if self.reset_after is not None:
+            deadline = loop.time() + self.reset_after
+        sent = 0
+        try:
+            while True:
+                timeout = None
+                if self.trickle_bytes:
+                    timeout = self.trickle_interval
+                if deadline is not None:
+                    remaining = max(0, deadline - loop.time())
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                await asyncio.wait([read_task], timeout=timeout)
+                if read_task.done():
+                    # the client closed the connection (or reset it)
+                    break
+                if deadline is not None and loop.time() >= deadline:
+                    self._reset(writer)
+                    break
+                if self.trickle_bytes:
+                    writer.write(self._trickle_data(sent))
+                    sent += self.trickle_bytes
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            read_task.cancel()
+            writer.close()
+            self.connections -= 1
+
+    async def serve(self, port):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, self.report)
+        server = await asyncio.start_server(self.handle, None, port,
+                backlog=BACKLOG, reuse_address=True)
+        reporter = asyncio.ensure_future(self._report_changes())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reporter.cancel()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--trickle-bytes', type=int, action='store', default=0, metavar='<bytes>',
+            help='Send <bytes> bytes of a response that never ends on each connection, every so often (default: 0).')
+    parser.add_argument('-i', '--trickle-interval', type=float, action='store', default=1, metavar='<seconds>',
+            help='Trickle bytes every <seconds> seconds (default: 1).')
+    parser.add_argument('-r', '--reset-after', type=float, action='store', metavar='<seconds>',
+            help='Reset each connection <seconds> seconds after it is accepted.')
+    parser.add_argument('-s', '--report-interval', type=float, action='store', default=1, metavar='<seconds>',
+            help='Report the number of connections held at most every <seconds> seconds (default: 1).')
+    parser.add_argument('port', type=int, action='store')
+    args = parser.parse_args(sys.argv[1:])
+
+    _raise_fd_limit()
+    server = NopServer(trickle_bytes=args.trickle_bytes,
+            trickle_interval=args.trickle_interval,
+            reset_after=args.reset_after,
+            report_interval=args.report_interval)
+    try:
+        asyncio.run(server.serve(args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+#
+# proxytest/origin.py - A stand-in for the origin HTTP server.
+#
+# "python3 -m http.server --cgi" runs a process for every request to
+# cgi-bin/slow, and it only keeps a few connections waiting to be accepted, so
+# under load it gives out before the proxy does.  This server handles every
+# connection on one asyncio event loop instead.  It serves static files from
+# the www directory with sendfile(), and generates the response of
+# /cgi-bin/slow?sleep=&size=&chunksize= itself, byte for byte as slow.c does,
+# except that sleep can be a fraction of a second and size can be gigabytes.
+# Requests are logged like http.server does, so the driver can follow them.
+#
+# It does not depend on the rest of proxytest, so it can be run as a script:
+#
+#     origin.py <port> [<www directory>]
+
+import argparse
+import asyncio
+import mimetypes
+import os
+import sys
+import time
+import urllib.parse
+
+SLOW_PATH = '/cgi-bin/slow'
+BACKLOG = 4096
+MAX_REQUEST_SIZE = 65536
+BLOCK_SIZE = 65536
+
+# The body of slow.c: byte i is '0' + (i % 10), but with '0' as '\n'.  Any
+# block of it starts at some offset into this pattern.
+PATTERN = b'\n123456789'
+PATTERN_BLOCK = PATTERN * (BLOCK_SIZE // len(PATTERN) + 1)
+
+def slow_body(start, length):
+    # the bytes of the body of slow.c from start to start + length, at most
+    # BLOCK_SIZE of them
+    offset = start % len(PATTERN)
+    return PATTERN_BLOCK[offset:offset + min(length, BLOCK_SIZE)]
+
+class OriginServer:
+    def __init__(self, www_dir, log=sys.stderr):
+        self.www_dir = os.path.abspath(www_dir)
+        self.log = log
+
+    def _log_request(self, request, status, size):
+        peer, request_line = request
+        self.log.write('%s - - [%s] "%s" %d %s\n' % \
+                (peer[0] if peer else '-',
+                    time.strftime('%d/%b/%Y %H:%M:%S'), request_line,
+                    status, size))
+        self.log.flush()
+
+    def _start_response(self, writer, request, status, reason, headers):
+        # The request is logged as soon as its response starts, as http.server
+        # does, so that the driver knows which requests the server is
+        # handling.
+        self._log_request(request, status, dict(headers)['Content-length'])
+        lines = ['HTTP/1.0 %d %s' % (status, reason), 'Connection: close'] + \
+                ['%s: %s' % (k, v) for (k, v) in headers]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+
+    async def _error(self, writer, request, status, reason):
+        body = ('%d %s\n' % (status, reason)).encode('utf-8')
+        self._start_response(writer, request, status, reason,
+                [('Content-type', 'text/plain'), ('Content-length', len(body))])
+        writer.write(body)
+        await writer.drain()
+
+    def _param(self, params, name, conv, default):
+        try:
+            return conv(params[name][0])
+        except (KeyError, ValueError):
+            return default
+
+    async def _slow(self, writer, request, query):
+        params = urllib.parse.parse_qs(query)
+        size = self._param(params, 'size', int, 0)
+        sleep_time = self._param(params, 'sleep', float, 0)
+        chunk_size = self._param(params, 'chunksize', int, 0)
+        if chunk_size <= 1:
+            chunk_size = size // 2
+        chunk_size = max(chunk_size, 1)
+
+        self._start_response(writer, request, 200, 'OK',
+                [('Content-length', size), ('Content-type', 'text/plain')])
+        await writer.drain()
+        i = 0
+        while i < size:
+            if sleep_time > 0:
+                await asyncio.sleep(sleep_time)
+            chunk = min(i + chunk_size, size)
+            while i < chunk:
+                buf = slow_body(i, chunk - i)
+                writer.write(buf)
+                i += len(buf)
+                await writer.drain()
+
+    async def _static(self, writer, request, path):
+        filename = os.path.abspath(os.path.join(self.www_dir,
+            urllib.parse.unquote(path).lstrip('/')))
+        if os.path.isdir(filename):
+            filename = os.path.join(filename, 'index.html')
+        if not (filename + os.sep).startswith(self.www_dir + os.sep) or \
+                not os.path.isfile(filename):
+            await self._error(writer, request, 404, 'File not found')
+            return
+
+        with open(filename, 'rb') as fh:
+            size = os.fstat(fh.fileno()).st_size
+            ctype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            self._start_response(writer, request, 200, 'OK',
+                    [('Content-type', ctype), ('Content-length', size)])
+            await writer.drain()
+            # uses sendfile() when it can
+            await asyncio.get_running_loop().sendfile(writer.transport, fh)
+
+    async def handle(self, reader, writer):
+        request = (writer.get_extra_info('peername'), '-')
+        try:
+            try:
+                data = await reader.readuntil(b'\r\n\r\n')
+            except asyncio.LimitOverrunError:
+                await self._error(writer, request, 400, 'Bad request')
+                return
+            request_line = data.split(b'\r\n', 1)[0].decode('utf-8', 'replace')
+            request = (request[0], request_line)
+            try:
+                method, uri, version = request_line.split()
+            except ValueError:
+                await self._error(writer, request, 400, 'Bad request')
+                return
+            if method != 'GET':
+                await self._error(writer, request, 501, 'Not implemented')
+                return
+
+            (scheme, netloc, path, params, query, fragment) = \
+                    urllib.parse.urlparse(uri)
+            if path == SLOW_PATH:
+                await self._slow(writer, request, query)
+            else:
+                await self._static(writer, request, path)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # the client went away
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port, host=None):
+        server = await asyncio.start_server(self.handle, host, port,
+                limit=MAX_REQUEST_SIZE, backlog=BACKLOG, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', type=int, action='store')
+    parser.add_argument('www_dir', type=str, action='store', nargs='?', default='.')
+    args = parser.parse_args(sys.argv[1:])
+
+    try:
+        asyncio.run(OriginServer(args.www_dir).serve(args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# proxytest/ports.py - Allocating TCP ports for test servers.
+
+import random
+import socket
+import struct
+import threading
+
+from .errors import PortWaitTimeout
+from .readiness import wait_until
+
+PROC_NET_TCP_FILES = ('/proc/net/tcp', '/proc/net/tcp6')
+TCP_LISTEN = 0x0A
+PORT_RANGE = (1024, 65535)
+
+# Hands out TCP ports for test servers without spawning any processes.
+# Listening sockets are found by reading /proc/net/tcp{,6} directly, and a port
+# is only handed out if it can actually be bound.  Ports that have been handed
+# out stay leased until they are released, so concurrent tests in the same
+# driver never get the same port.
+class PortAllocator:
+
+    def __init__(self, port_range=PORT_RANGE):
+        self.port_range = port_range
+        self.leased = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def _decode_addr(cls, hex_addr):
+        # addresses in /proc/net/tcp{,6} are stored as 32-bit words in host
+        # byte order
+        raw = bytes.fromhex(hex_addr)
+        words = [raw[i:i+4] for i in range(0, len(raw), 4)]
+        raw = b''.join([struct.pack('=I', struct.unpack('>I', w)[0]) for w in words])
+        if len(raw) == 4:
+            return socket.inet_ntop(socket.AF_INET, raw)
+        else:
+            return '[%s]' % socket.inet_ntop(socket.AF_INET6, raw)
+
+    @classmethod
+    def listening_ports(cls):
+        ports = {}
+        for filename in PROC_NET_TCP_FILES:
+            try:
+                with open(filename, 'r') as fh:
+                    lines = fh.readlines()[1:]
+            except OSError:
+                continue
+            for line in lines:
+                cols = line.split()
+                if int(cols[3], 16) != TCP_LISTEN:
+                    continue
+                addr, port = cols[1].split(':')
+                ports.setdefault(int(port, 16), cls._decode_addr(addr))
+        return ports
+
+    @classmethod
+    def port_in_use(cls, port):
+        return cls.listening_ports().get(port)
+
+    @classmethod
+    def wait_for_port_use(cls, port, timeout):
+        # poll with a backoff that starts at a millisecond, so that a server
+        # that comes up quickly is noticed right away
+        if not wait_until(lambda: cls.port_in_use(port) is not None, timeout,
+                max_delay=0.1):
+            raise PortWaitTimeout
+
+    @classmethod
+    def can_bind(cls, port):
+        for family, addr in ((socket.AF_INET6, '::'), (socket.AF_INET, '0.0.0.0')):
+            try:
+                s = socket.socket(family, socket.SOCK_STREAM)
+            except OSError:
+                continue
+            try:
+                s.bind((addr, port))
+            except OSError:
+                return False
+            finally:
+                s.close()
+        return True
+
+    def reserve(self):
+        low, high = self.port_range
+        start = random.randint(low, high)
+        with self.lock:
+            for i in range(high - low + 1):
+                port = low + (start - low + i) % (high - low + 1)
+                if port in self.leased:
+                    continue
+                if self.can_bind(port):
+                    self.leased.add(port)
+                    return port
+        return None
+
+    def release(self, port):
+        with self.lock:
+            self.leased.discard(port)
@@ -0,0 +1,158 @@
+# proxytest/probes.py - Checking how the proxy handles concurrent requests.
+#
+# A probe gathers evidence about the concurrency model of the proxy while a
+# test is running, beyond the number of threads and processes, which
+# ProxyTest.check_mode() already checks for every mode.  Probes are looked up
+# by mode in PROBES.
+
+import logging
+import os
+import re
+import threading
+
+EPOLL_LINK = 'anon_inode:[eventpoll]'
+EPOLL_WAIT_SYSCALLS = ('epoll_wait', 'epoll_pwait', 'epoll_pwait2')
+EPOLL_WAIT_RE = re.compile(r'^(?:\d+\s+)?(?:<\.\.\. )?(%s)\b.*\)\s+=\s+(-?\d+)' % \
+        ('|'.join(EPOLL_WAIT_SYSCALLS)))
+
+class ConcurrencyProbe:
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.logger = logging.getLogger('.')
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def check(self, test, connections):
+        # Return whether the evidence gathered while connections requests were
+        # in flight is consistent with the mode, or None if there is none.
+        return None
+
+    def summary(self):
+        return {}
+
+# Checks that an epoll-based proxy multiplexes its connections on one thread.
+# The epoll instances of the proxy, and the file descriptors registered with
+# each of them, are sampled from /proc/<pid>/fdinfo.  If the proxy was run
+# under strace (see ProxyTest.start_proxy()), the number of events returned by
+# each call to epoll_wait() is also reported, to show how well the event loop
+# batches under load.
+class EpollProbe(ConcurrencyProbe):
+    def __init__(self, pid, interval=0.1, trace_file=None):
+        super(EpollProbe, self).__init__(pid, interval)
+        self.trace_file = trace_file
+        self.max_instances = 0
+        self.max_targets = 0
+        self.wakeups = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def read_epoll_targets(cls, pid):
+        # return a dictionary mapping each epoll file descriptor of the process
+        # to the set of file descriptors registered with it
+        targets = {}
+        try:
+            fds = os.listdir('/proc/%d/fd' % pid)
+        except OSError:
+            return None
+        for fd in fds:
+            try:
+                if os.readlink('/proc/%d/fd/%s' % (pid, fd)) != EPOLL_LINK:
+                    continue
+                with open('/proc/%d/fdinfo/%s' % (pid, fd), 'r') as fh:
+                    targets[int(fd)] = set([int(line.split()[1])
+                        for line in fh if line.startswith('tfd:')])
+            except OSError:
+                # closed in the meantime
+                continue
+        return targets
+
+    @classmethod
+    def parse_trace(cls, filename):
+        # return the number of events returned by each call to epoll_wait()
+        # that returned some
+        events = []
+        with open(filename, 'r') as fh:
+            for line in fh:
+                m = EPOLL_WAIT_RE.search(line)
+                if m is not None and int(m.group(2)) > 0:
+                    events.append(int(m.group(2)))
+        return events
+
+    def sample(self):
+        targets = self.read_epoll_targets(self.pid)
+        if targets is None:
+            return False
+        self.max_instances = max(self.max_instances, len(targets))
+        for fds in targets.values():
+            self.max_targets = max(self.max_targets, len(fds))
+        return True
+
+    def _run(self):
+        while not self.stopped.is_set():
+            if not self.sample():
+                break
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='epoll-probe',
+                daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.trace_file is not None:
+            try:
+                self.wakeups = self.parse_trace(self.trace_file)
+            except OSError as e:
+                self.logger.warning('Unable to read strace output: %s' % (str(e)))
+
+    def check(self, test, connections):
+        status = True
+        if self.max_instances == 0:
+            self.logger.error('No epoll instance was found in the proxy.')
+            return False
+
+        # the listening socket is registered, as well as every client
+        if self.max_targets < connections + 1:
+            level = logging.ERROR
+            status = False
+        else:
+            level = logging.INFO
+        self.logger.log(level, 'At most %d file descriptors were registered with epoll, while %d requests were in flight.' % \
+                (self.max_targets, connections))
+
+        if test.num_threads_realtime is not None and \
+                test.num_threads_realtime > 1:
+            self.logger.error('The event loop does not run on a single thread: (%d threads)' % \
+                    (test.num_threads_realtime))
+            status = False
+
+        if self.wakeups:
+            summary = self.summary()
+            self.logger.info('%d epoll_wait() wakeups, with %.2f events per wakeup on average (at most %d).' % \
+                    (summary['wakeups'], summary['events_per_wakeup'],
+                        summary['max_events_per_wakeup']))
+        return status
+
+    def summary(self):
+        summary = {
+                'epoll_instances': self.max_instances,
+                'max_registered_fds': self.max_targets,
+                }
+        if self.wakeups:
+            summary.update(wakeups=len(self.wakeups),
+                    events_per_wakeup=sum(self.wakeups) / len(self.wakeups),
+                    max_events_per_wakeup=max(self.wakeups))
+        return summary
+
+PROBES = {
+        'epoll': EpollProbe,
+        }
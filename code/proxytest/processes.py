@@ -0,0 +1,115 @@
+# proxytest/processes.py - Starting and stopping the processes of a test.
+#
+# Every process is started in a process group of its own, so that it can be
+# stopped along with whatever children it has (e.g., the CGI programs run by
+# http.server, or the workers of the proxy), without touching any process
+# that the driver did not start, such as those of other tests or of other
+# users.  Stopping escalates from SIGINT to SIGTERM to SIGKILL, and waits for
+# the processes on their pidfds (or with waitpid(), where there are none), so
+# it returns as soon as they have exited.
+
+import atexit
+import logging
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+import weakref
+
+# (signal, seconds to wait for the processes to exit after sending it)
+ESCALATION = ((signal.SIGINT, 1), (signal.SIGTERM, 1), (signal.SIGKILL, 1))
+# for a process under a memory checker, which checks for leaks as it exits
+MEM_CHECK_ESCALATION = ((signal.SIGINT, 10), (signal.SIGTERM, 1),
+        (signal.SIGKILL, 1))
+
+# the supervisors whose processes are stopped when the driver exits
+_supervisors = weakref.WeakSet()
+
+def _signal_group(proc, sig):
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        # the group is gone
+        pass
+
+def _wait_pidfds(procs, timeout):
+    # Wait for procs to exit, but no more than timeout seconds; raise OSError
+    # if pidfds are not supported.
+    deadline = time.monotonic() + timeout
+    poller = select.poll()
+    fds = {}
+    try:
+        for p in procs:
+            fd = os.pidfd_open(p.pid)
+            fds[fd] = p
+            poller.register(fd, select.POLLIN)
+        while fds:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for (fd, event) in poller.poll(remaining * 1000):
+                # reap it
+                fds[fd].poll()
+                poller.unregister(fd)
+                del fds[fd]
+                os.close(fd)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+def _wait(procs, timeout):
+    try:
+        _wait_pidfds(procs, timeout)
+    except (AttributeError, OSError):
+        deadline = time.monotonic() + timeout
+        for p in procs:
+            try:
+                p.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                pass
+
+class ProcessSupervisor:
+    def __init__(self):
+        self.procs = []
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('.')
+        _supervisors.add(self)
+
+    def start(self, cmd, **kwargs):
+        p = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+        with self.lock:
+            self.procs.append(p)
+        return p
+
+    def stop(self, procs, escalation=ESCALATION):
+        # Stop procs, which were started by start(), along with the rest of
+        # their process groups.
+        procs = [p for p in procs if p is not None]
+        for (sig, timeout) in escalation:
+            running = [p for p in procs if p.poll() is None]
+            if not running:
+                break
+            self.logger.debug('kill -%s %s' % (sig.name[3:],
+                ' '.join(['-%d' % (p.pid) for p in running])))
+            for p in running:
+                _signal_group(p, sig)
+            _wait(running, timeout)
+
+        # Whatever is left of their groups, e.g., children that outlived
+        # them, is killed outright.
+        for p in procs:
+            _signal_group(p, signal.SIGKILL)
+        with self.lock:
+            self.procs = [p for p in self.procs if p not in procs]
+
+    def stop_all(self):
+        with self.lock:
+            procs = list(self.procs)
+        self.stop(procs)
+
+@atexit.register
+def _stop_all():
+    for supervisor in list(_supervisors):
+        supervisor.stop_all()
@@ -0,0 +1,35 @@
+# proxytest/readiness.py - Waiting for conditions, without fixed sleeps.
+
+import time
+
+def wait_until(condition, timeout, min_delay=0.001, max_delay=0.05):
+    # Call condition() until it returns a true value or until timeout seconds
+    # have passed, backing off from min_delay to max_delay between calls.
+    # Return the last value returned by condition().
+    deadline = time.monotonic() + timeout
+    delay = min_delay
+    while True:
+        value = condition()
+        if value:
+            return value
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return value
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+def wait_until_stable(measure, timeout, settle=0.25, interval=0.05):
+    # Call measure() until it has returned the same value for settle seconds,
+    # or until timeout seconds have passed.  Return the last value measured.
+    deadline = time.monotonic() + timeout
+    value = measure()
+    since = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now - since >= settle or now >= deadline:
+            return value
+        time.sleep(min(interval, deadline - now))
+        new_value = measure()
+        if new_value != value:
+            value = new_value
+            since = time.monotonic()
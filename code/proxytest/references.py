@@ -0,0 +1,89 @@
+# proxytest/references.py - The expected content of the URLs used by tests.
+
+import os
+import threading
+import urllib.parse
+
+from .compare import file_digest
+from .config import WWW_DIR
+from .fetch import FETCH_OK
+
+# The expected content of a URL, as a file in WWW_DIR.  Like a finished Fetch,
+# it has a digest and size and is compared to the content of output.  Its
+# latency is that of fetch, a direct fetch of the URL made only to time it, if
+# there is one.
+class Reference:
+    def __init__(self, output, digest, size, fetch=None):
+        self.output = output
+        self.digest = digest
+        self.size = size
+        self.fetch = fetch
+
+    @property
+    def latency(self):
+        if self.fetch is None or self.fetch.wait() != FETCH_OK:
+            return None
+        return self.fetch.latency
+
+    @property
+    def returncode(self):
+        return FETCH_OK
+
+    def poll(self):
+        return FETCH_OK
+
+    def wait(self):
+        return FETCH_OK
+
+# The expected content of every URL used in a run, so that it is looked up only
+# once per run rather than once per test.  URLs on the local server that map to
+# a static file in WWW_DIR are read from that file directly.  Everything else
+# (CGI output and non-local URLs) is fetched directly from the server the first
+# time it is needed, and its digest is kept.  The static files are also
+# fetched directly once, if time_fetch is given, so that their direct latency
+# is known.  The "i" query parameter, which tests add to make URLs unique, is
+# not part of the key.
+class ReferenceStore:
+    CGI_DIRS = ('cgi-bin/', 'htbin/')
+
+    def __init__(self, www_dir=WWW_DIR):
+        self.www_dir = www_dir
+        self.references = {}
+        self.lock = threading.Lock()
+
+    def _key(self, url, local_netloc):
+        # return the key, the URL to fetch, and the static file, if any
+        (scheme, netloc, path, params, query, fragment) = \
+                urllib.parse.urlparse(url)
+        if netloc != local_netloc:
+            return url, url, None
+        query = '&'.join([q for q in query.split('&')
+                if q and q.split('=', 1)[0] != 'i'])
+        url = urllib.parse.urlunparse((scheme, netloc, path, params, query, ''))
+        path = path.lstrip('/')
+        if not path.startswith(self.CGI_DIRS):
+            filename = os.path.join(self.www_dir, path)
+            if os.path.isfile(filename):
+                return path, url, filename
+        if query:
+            return '%s?%s' % (path, query), url, None
+        return path, url, None
+
+    def get(self, url, local_netloc, fetch, time_fetch=None):
+        key, url, filename = self._key(url, local_netloc)
+        with self.lock:
+            ref = self.references.get(key)
+            if ref is not None and ref.poll() not in (None, FETCH_OK):
+                # an earlier fetch failed; try again
+                ref = None
+            if ref is None:
+                if filename is not None:
+                    digest, size = file_digest(filename)
+                    timer = None
+                    if time_fetch is not None:
+                        timer = time_fetch(url)
+                    ref = Reference(filename, digest, size, timer)
+                else:
+                    ref = fetch(url)
+                self.references[key] = ref
+        return ref
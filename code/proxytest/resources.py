@@ -0,0 +1,128 @@
+# proxytest/resources.py - Sampling the resource usage of the proxy.
+
+import csv
+import os
+import threading
+import time
+
+# Samples the resource usage of a process, from /proc, in a background thread:
+# its number of threads, the number of processes (itself and its children), its
+# number of open file descriptors, its resident set size (bytes) and the CPU
+# time it has used (seconds).  Sampling stops when the process exits.
+class ResourceSampler:
+    FIELDS = ('time', 'threads', 'processes', 'fds', 'rss', 'cpu')
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def read_threads(cls, pid):
+        try:
+            return len(os.listdir('/proc/%d/task' % pid))
+        except OSError:
+            return None
+
+    @classmethod
+    def read_children(cls, pid):
+        children = set()
+        try:
+            for tid in os.listdir('/proc/%d/task' % pid):
+                with open('/proc/%d/task/%s/children' % (pid, tid), 'r') as fh:
+                    children.update([int(c) for c in fh.read().split()])
+        except OSError:
+            return None
+        return children
+
+    @classmethod
+    def read_fds(cls, pid):
+        try:
+            return len(os.listdir('/proc/%d/fd' % pid))
+        except OSError:
+            return None
+
+    @classmethod
+    def read_rss(cls, pid):
+        try:
+            with open('/proc/%d/status' % pid, 'r') as fh:
+                for line in fh:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        # kernel threads and zombies have no VmRSS
+        return 0
+
+    @classmethod
+    def read_cpu(cls, pid):
+        try:
+            with open('/proc/%d/stat' % pid, 'r') as fh:
+                stat = fh.read()
+        except OSError:
+            return None
+        # skip past the command name, which might contain spaces; utime and
+        # stime are fields 14 and 15
+        cols = stat[stat.rindex(')') + 2:].split()
+        return (int(cols[11]) + int(cols[12])) / os.sysconf('SC_CLK_TCK')
+
+    def sample(self):
+        threads = self.read_threads(self.pid)
+        children = self.read_children(self.pid)
+        fds = self.read_fds(self.pid)
+        rss = self.read_rss(self.pid)
+        cpu = self.read_cpu(self.pid)
+        if None in (threads, children, fds, rss, cpu):
+            return None
+        sample = dict(time=time.monotonic(), threads=threads,
+                processes=len(children) + 1, fds=fds, rss=rss, cpu=cpu)
+        with self.lock:
+            self.samples.append(sample)
+        return sample
+
+    def _run(self):
+        while not self.stopped.is_set():
+            if self.sample() is None:
+                break
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='sampler',
+                daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def latest(self, field):
+        with self.lock:
+            if not self.samples:
+                return None
+            return self.samples[-1][field]
+
+    def max(self, field, since=None):
+        with self.lock:
+            values = [s[field] for s in self.samples
+                    if since is None or s['time'] >= since]
+        if not values:
+            return None
+        return max(values)
+
+    def summary(self):
+        return dict([(field, self.max(field)) for field in self.FIELDS[1:]])
+
+    def export(self, filename):
+        with self.lock:
+            samples = list(self.samples)
+        start_time = samples[0]['time'] if samples else 0
+        with open(filename, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=self.FIELDS)
+            writer.writeheader()
+            for sample in samples:
+                sample = dict(sample, time='%.3f' % (sample['time'] - start_time))
+                writer.writerow(sample)
@@ -0,0 +1,91 @@
+# proxytest/results.py - Machine-readable results of a run of the tests.
+#
+# A results writer is given an event for the start of the run, one for each
+# test, as its result is collected, and one for the end of the run, with the
+# score.  Each event is written out (and flushed) right away, so that a run
+# can be followed, or aggregated with others, as it goes.  Writers are looked
+# up by format in RESULTS_WRITERS.
+
+import json
+import time
+import xml.sax.saxutils
+
+class ResultsWriter:
+    def __init__(self, fh):
+        self.fh = fh
+
+    def start(self, info):
+        pass
+
+    def test(self, result):
+        pass
+
+    def finish(self, score):
+        pass
+
+    def _write(self, s):
+        self.fh.write(s)
+        self.fh.flush()
+
+# One JSON object per line, with an "event" of "start", "test" or "end".
+class JSONLinesWriter(ResultsWriter):
+    def _event(self, event, d):
+        d = dict(d, event=event, time=time.time())
+        self._write(json.dumps(d, sort_keys=True) + '\n')
+
+    def start(self, info):
+        self._event('start', info)
+
+    def test(self, result):
+        self._event('test', result)
+
+    def finish(self, score):
+        self._event('end', score)
+
+# JUnit XML, with a <testsuite> for each test class and a <testcase> for each
+# request it made, as well as for the memory and concurrency checks.
+class JUnitWriter(ResultsWriter):
+    def _attrs(self, **attrs):
+        return ''.join([' %s=%s' % (k, xml.sax.saxutils.quoteattr(str(v)))
+                for k, v in attrs.items() if v is not None])
+
+    def _testcase(self, classname, name, reason, duration=None, output=None):
+        s = '    <testcase%s>\n' % \
+                self._attrs(classname=classname, name=name, time=duration)
+        if reason is not None:
+            s += '      <failure%s/>\n' % (self._attrs(message=reason))
+        if output is not None:
+            s += '      <system-out>%s</system-out>\n' % \
+                    (xml.sax.saxutils.escape(json.dumps(output, sort_keys=True)))
+        s += '    </testcase>\n'
+        return s
+
+    def start(self, info):
+        self._write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites%s>\n' % \
+                self._attrs(name='proxy', mode=info.get('mode')))
+
+    def test(self, result):
+        classname = result['test']
+        # (name, failure reason, duration, output)
+        cases = [(r['url'], r['reason'], r['proxy']['latency'], r)
+                for r in result['requests']]
+        for key in ('mem_mgmt', 'clean_shutdown', 'concurrency_model'):
+            check = result.get(key)
+            if check is None:
+                continue
+            reason = None if check['success'] else '%s check failed' % (key)
+            cases.append((key, reason, None, check))
+        failures = len([c for c in cases if c[1] is not None])
+        self._write('  <testsuite%s>\n' % \
+                self._attrs(name=classname, tests=len(cases),
+                    failures=failures, time=result['duration']) + \
+                ''.join([self._testcase(classname, *c) for c in cases]) + \
+                '  </testsuite>\n')
+
+    def finish(self, score):
+        self._write('</testsuites>\n')
+
+RESULTS_WRITERS = {
+        'jsonl': JSONLinesWriter,
+        'junit': JUnitWriter,
+        }
@@ -0,0 +1,67 @@
+# proxytest/sanitizer.py - Parsing the reports of AddressSanitizer and
+# LeakSanitizer.
+#
+# LeakSanitizer checks for leaks when the program exits (normally), and writes
+# its report to <log_path>.<pid> only if it finds some.  Leaks become the same
+# LeakRecords as with valgrind: direct leaks are "definitely lost", and
+# indirect leaks "indirectly lost".  LeakSanitizer has no notion of memory
+# still reachable at exit.
+
+import glob
+import os
+import re
+
+from .valgrind import LeakParser, LeakRecord
+
+SANITIZER_LEAK_KINDS = {
+        'Direct': 'definitely lost',
+        'Indirect': 'indirectly lost',
+        }
+
+SANITIZER_LEAK_RE = re.compile(r'^(Direct|Indirect) leak of (\d+) byte\(s\) in (\d+) object\(s\)')
+SANITIZER_FRAME_RE = re.compile(r'^\s*#\d+ 0x[0-9a-f]+\s+(?:in (\S+) )?(.*)$')
+SANITIZER_ERROR_RE = re.compile(r'^==\d+==ERROR: (\w+Sanitizer: .*)$')
+INTERCEPTOR_RE = re.compile(r'^_+interceptor_')
+
+class SanitizerLeakParser(LeakParser):
+    def __init__(self):
+        super(SanitizerLeakParser, self).__init__()
+        self.record = None
+
+    def feed(self, data):
+        for line in data.splitlines():
+            self.feed_line(line)
+
+    def close(self):
+        self.record = None
+
+    def feed_line(self, line):
+        if self.record is not None:
+            m = SANITIZER_FRAME_RE.match(line)
+            if m is not None:
+                self.record.frames.append(self._frame(m.group(1), m.group(2)))
+                return
+            self.record = None
+
+        m = SANITIZER_LEAK_RE.match(line)
+        if m is not None:
+            self.record = LeakRecord(SANITIZER_LEAK_KINDS[m.group(1)],
+                    int(m.group(2)), int(m.group(3)))
+            self.records.append(self.record)
+            return
+
+        m = SANITIZER_ERROR_RE.match(line)
+        if m is not None and not m.group(1).startswith('LeakSanitizer: detected'):
+            self.errors.append(m.group(1))
+
+    def _frame(self, fn, location):
+        # format frames as valgrind does: "fn (file:line)" or "fn (in obj)"
+        if fn is None:
+            fn = '???'
+        fn = INTERCEPTOR_RE.sub('', fn)
+        if location.startswith('('):
+            return '%s (in %s)' % (fn, location.strip('()'))
+        return '%s (%s)' % (fn, os.path.basename(location))
+
+def sanitizer_logs(log_path):
+    return sorted(glob.glob('%s.*' % (log_path)))
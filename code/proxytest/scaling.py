@@ -0,0 +1,156 @@
+# proxytest/scaling.py - Measuring how the concurrency of the proxy scales.
+
+import logging
+import resource
+import time
+
+from .bench import BenchmarkTest, latency_stats
+from .config import CONCURRENCY_SLACK
+
+# Like GenericConcurrencyProxyTest, but with more and more slow/fast pairs of
+# requests, one step at a time.  At each step, the slow requests are issued
+# first and, once they have reached the server (or it is clear that they will
+# not all get there), the fast ones.  The report has, for each step, how many
+# fast requests still finished (by more than CONCURRENCY_SLACK) before the slow
+# request of their pair, and how the latency of both degrades: a scalability
+# curve for the proxy.
+class ScaleOutConcurrencyProxyTest(BenchmarkTest):
+    SLOW_FILE = 'cgi-bin/slow?sleep=1&size=4096'
+    FAST_FILE = 'foo.html'
+    FILES = [SLOW_FILE, FAST_FILE]
+    DESCRIPTION = 'Scale-out Concurrency Test'
+    EXTENDED_DESCRIPTION = \
+            'Issuing more and more fast requests to the proxy, while it ' + \
+            'is busy handling as many slow requests that were issued first.'
+
+    STEPS = (10, 50, 200, 1000)
+    TIMEOUT = 30
+    SLEEP_BETWEEN_SEND = 1
+    # how long to wait for the slow requests of a step to reach the server,
+    # once they have been sent
+    SLOW_WAIT = 5
+
+    def __init__(self, *args, steps=None, **kwargs):
+        if steps is not None:
+            self.STEPS = steps
+        # the proxy inherits the limit, so it is raised before it is started
+        self._raise_fd_limit(max(self.STEPS))
+
+        super(ScaleOutConcurrencyProxyTest, self).__init__(*args, **kwargs)
+
+    @classmethod
+    def _raise_fd_limit(cls, pairs):
+        # Each pair takes two sockets in the driver, and up to four in the
+        # proxy.
+        wanted = 4 * pairs + 256
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY or soft >= wanted:
+            return
+        if hard != resource.RLIM_INFINITY and hard < wanted:
+            logging.getLogger('.').warning('Only %d file descriptors are allowed; %d pairs of requests need about %d.' % \
+                    (hard, pairs, wanted))
+            wanted = hard
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    def _url(self, filename, step, i):
+        if '?' in filename:
+            sep = '&'
+        else:
+            sep = '?'
+        return 'http://%s:%d/%s%si=%d-%d' % \
+                (self.server_host, self.server_port, filename, sep, step, i)
+
+    def _run_step(self, step, pairs, refs):
+        self.logger.info('Step %d: issuing %d slow requests, then %d fast requests' % \
+                (step, pairs, pairs))
+        start_time = time.monotonic()
+        slow = [self.fetcher.fetch(self._url(self.SLOW_FILE, step, i), None,
+                    self.TIMEOUT, proxy=self.proxy_url,
+                    sleep_between_send=self.SLEEP_BETWEEN_SEND)
+                for i in range(pairs)]
+
+        # Wait for the slow requests to reach the server, and for the proxy
+        # to have settled on the threads or processes handling them.
+        pattern = '/%s&i=%d-' % (self.SLOW_FILE, step)
+        self.wait_for_server_requests(pattern, pairs,
+                2 * self.SLEEP_BETWEEN_SEND + self.SLOW_WAIT)
+        slow_reached = self.count_server_requests(pattern)
+        self.wait_for_proxy_tasks(1)
+        self.sampler.sample()
+
+        fast = [self.fetcher.fetch(self._url(self.FAST_FILE, step, i), None,
+                    self.TIMEOUT, proxy=self.proxy_url)
+                for i in range(pairs)]
+        for f in slow + fast:
+            f.wait()
+        elapsed = time.monotonic() - start_time
+        self.sampler.sample()
+
+        errors = {}
+        successes = 0
+        fast_before_slow = 0
+        latencies = { 'slow': [], 'fast': [] }
+        margins = []
+        for (s, f) in zip(slow, fast):
+            ok = True
+            for (kind, fetch) in (('slow', s), ('fast', f)):
+                error = self._status(fetch, refs[kind])
+                if error is not None:
+                    errors[error] = errors.get(error, 0) + 1
+                    ok = False
+                else:
+                    latencies[kind].append(fetch.latency)
+            margin = self.finished_before(f, s)
+            if margin is not None:
+                margins.append(margin)
+            if margin is not None and margin > CONCURRENCY_SLACK:
+                fast_before_slow += 1
+            elif ok:
+                ok = False
+            if ok:
+                successes += 1
+
+        result = {
+                'pairs': pairs,
+                'successes': successes,
+                'fast_before_slow': fast_before_slow,
+                'slow_reached_server': slow_reached,
+                'errors': errors,
+                'duration': elapsed,
+                'slow_latency': latency_stats(latencies['slow']),
+                'fast_latency': latency_stats(latencies['fast']),
+                # how long before the slow request of each pair the fast one
+                # finished
+                'margin': latency_stats(margins),
+                }
+        for field in ('threads', 'processes', 'fds'):
+            result['max_%s' % (field)] = self.sampler.max(field, start_time)
+        self.logger.info('Step %d: %d/%d pairs succeeded; %d fast requests finished first' % \
+                (step, successes, pairs, fast_before_slow))
+        return result
+
+    def run(self):
+        refs = {}
+        for (kind, filename) in (('slow', self.SLOW_FILE), ('fast', self.FAST_FILE)):
+            url = 'http://%s:%d/%s' % \
+                    (self.server_host, self.server_port, filename)
+            refs[kind] = self._direct_reference(url, filename)
+
+        steps = []
+        for (step, pairs) in enumerate(self.STEPS):
+            steps.append(self._run_step(step, pairs, refs))
+            if steps[-1]['successes'] == 0:
+                # there is no point in adding load to a proxy that no longer
+                # handles any concurrent requests
+                self.logger.warning('No pair of requests succeeded with %d pairs; not trying more.' % \
+                        (pairs))
+                break
+
+        self.report = {
+                'mode': self.mode,
+                'origin': self.origin,
+                'steps': steps,
+                'resources': self.sampler.summary(),
+                }
+        self.attempts = sum([s['pairs'] for s in steps])
+        self.successes = sum([s['successes'] for s in steps])
@@ -0,0 +1,168 @@
+# proxytest/slowclient.py - This is a client that makes an HTTP request very
+#                           slowly, so it forces the proxy to read the request
+#                           across multiple reads.
+#
+# usage: slow-client.py [-m <seconds>] [-o <file>] [-x <proxy_url>]
+#                       [-b <seconds>] [-n <bytes>] [-c <num>] <url>
+#
+# By default, the request is sent in two parts, each after sleeping -b
+# seconds.  With -n, it is sent <bytes> bytes at a time instead, with the
+# same (possibly fractional) sleep before each send.  With -c, as many
+# connections make the request at the same time, all from this one process;
+# the body received on connection i is then written to <file>.<i>, if -o was
+# given, and discarded otherwise.
+#
+# The exit status is that of curl: 0 if every request got a response, 7 if a
+# connection could not be made, and 28 if it timed out.
+
+import argparse
+import asyncio
+import socket
+import sys
+import urllib.parse
+
+RECV_SIZE = 65536
+EXIT_ERROR = 1
+EXIT_CONNECT = 7
+EXIT_TIMEOUT = 28
+
+def _host_port(netloc, default_port):
+    try:
+        host, port = netloc.split(':')
+    except ValueError:
+        return netloc, default_port
+    return host, int(port)
+
+def request_target(url, proxy):
+    # the host and port to connect to, and the request to send there
+    (scheme, netloc, path, params, query, fragment) = url
+    if proxy:
+        host, port = _host_port(proxy.netloc, 8080)
+        uri = urllib.parse.urlunparse(url)
+    else:
+        host, port = _host_port(netloc, 80)
+        if not path:
+            path = '/'
+        if query:
+            uri = '%s?%s' % (path, query)
+        else:
+            uri = path
+    request = 'GET %s HTTP/1.0\r\nHost: %s\r\n\r\n' % (uri, netloc)
+    return host, port, request.encode('utf-8')
+
+def request_parts(request, send_bytes):
+    if send_bytes:
+        return [request[i:i + send_bytes]
+                for i in range(0, len(request), send_bytes)]
+    # the request line, then the rest
+    i = request.find(b'\r\n') + 2
+    return [request[:i], request[i:]]
+
+async def connect(loop, host, port):
+    addrs = await loop.getaddrinfo(host, port, family=socket.AF_UNSPEC,
+            type=socket.SOCK_STREAM)
+    exc = None
+    for (family, socktype, proto, canonname, sockaddr) in addrs:
+        s = socket.socket(family, socktype)
+        s.setblocking(False)
+        try:
+            await loop.sock_connect(s, sockaddr)
+        except OSError as e:
+            s.close()
+            exc = e
+        else:
+            return s
+    if exc is None:
+        raise OSError('No addresses found for %s' % (host))
+    raise exc
+
+async def slow_request(host, port, parts, sleep_between_send, output):
+    loop = asyncio.get_running_loop()
+    s = await connect(loop, host, port)
+    try:
+        for part in parts:
+            await asyncio.sleep(sleep_between_send)
+            await loop.sock_sendall(s, part)
+
+        # Receive into the same buffer every time.  Until the end of the
+        # headers has been found, what has been received so far is kept in
+        # headers; after that, the body is written out as it comes.
+        buf = bytearray(RECV_SIZE)
+        view = memoryview(buf)
+        headers = bytearray()
+        in_body = False
+        while True:
+            n = await loop.sock_recv_into(s, buf)
+            if not n:
+                break
+            if in_body:
+                if output is not None:
+                    output.write(view[:n])
+                continue
+            start = max(len(headers) - 3, 0)
+            headers += view[:n]
+            i = headers.find(b'\r\n\r\n', start)
+            if i >= 0:
+                in_body = True
+                if output is not None:
+                    output.write(headers[i + 4:])
+                headers = None
+    finally:
+        s.close()
+        if output is not None:
+            output.flush()
+
+def _outputs(output, connections):
+    if connections == 1:
+        if output is None or output == '-':
+            return [sys.stdout.buffer]
+        return [open(output, 'wb')]
+    if output is None:
+        return [None] * connections
+    return [open('%s.%d' % (output, i), 'wb') for i in range(connections)]
+
+async def run(args):
+    host, port, request = request_target(args.url, args.proxy)
+    parts = request_parts(request, args.send_bytes)
+    outputs = _outputs(args.output, args.connections)
+    try:
+        coros = [slow_request(host, port, parts, args.sleep_between_send, o)
+                for o in outputs]
+        results = await asyncio.wait_for(
+                asyncio.gather(*coros, return_exceptions=True), args.max_time)
+    except asyncio.TimeoutError:
+        return EXIT_TIMEOUT
+    finally:
+        for o in outputs:
+            if o is not None and o is not sys.stdout.buffer:
+                o.close()
+
+    status = 0
+    for r in results:
+        if isinstance(r, OSError):
+            sys.stderr.write('%s\n' % (r))
+            status = EXIT_CONNECT
+        elif isinstance(r, BaseException):
+            sys.stderr.write('%s: %s\n' % (type(r).__name__, r))
+            if not status:
+                status = EXIT_ERROR
+    return status
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--max-time', type=float, action='store', default=60)
+    parser.add_argument('-o', '--output', type=str, action='store')
+    parser.add_argument('-x', '--proxy', type=urllib.parse.urlparse, action='store')
+    parser.add_argument('-b', '--sleep-between-send', type=float, action='store', default=0, metavar='<seconds>',
+            help='Sleep <seconds> (e.g., 0.005 for 5 ms) before each send (default: 0).')
+    parser.add_argument('-n', '--send-bytes', type=int, action='store', default=0, metavar='<bytes>',
+            help='Send the request <bytes> bytes at a time (default: in two parts).')
+    parser.add_argument('-c', '--connections', type=int, action='store', default=1, metavar='<num>',
+            help='Make the request on <num> connections at once (default: 1).')
+    parser.add_argument('url', type=urllib.parse.urlparse, action='store')
+    args = parser.parse_args(sys.argv[1:])
+    if args.connections < 1:
+        parser.error('--connections must be at least 1')
+
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,203 @@
+# proxytest/suite.py - Running groups of tests and computing the score.
+
+import concurrent.futures
+import functools
+import os
+import sys
+import time
+
+from .config import LEAK_SITES
+
+class ProxyTestSuite:
+    def __init__(self, mode, test_classes, proxy_host='localhost',
+            server_host='localhost',
+            mem_mgmt=None, clean_shutdown=None, keep_files=False,
+            server_output=False, proxy_output=False,
+            verbose=False, jobs=1, sample_interval=0.1, samples_dir=None,
+            trace_epoll=False, mem_check='memcheck', valgrind_xml=False,
+            results=None, origin='http.server'):
+        self.mode = mode
+        self.test_classes = test_classes
+        self.proxy_host = proxy_host
+        self.server_host = server_host
+        self.mem_mgmt = mem_mgmt
+        self.clean_shutdown = clean_shutdown
+        self.keep_files = keep_files
+        self.server_output = server_output
+        self.proxy_output = proxy_output
+        self.verbose = verbose
+        self.jobs = jobs
+        self.sample_interval = sample_interval
+        self.samples_dir = samples_dir
+        self.trace_epoll = trace_epoll
+        self.valgrind_xml = valgrind_xml
+        self.origin = origin
+        if self.mem_mgmt is None and self.clean_shutdown is None:
+            mem_check = None
+        self.mem_check = mem_check
+        # a ResultsWriter, if results are also to be written out
+        self.results = results
+
+    def _run_test(self, cls):
+        p = cls(proxy_host=self.proxy_host,
+                server_host=self.server_host,
+                mem_check=self.mem_check,
+                keep_files=self.keep_files,
+                server_output=self.server_output,
+                proxy_output=self.proxy_output,
+                verbose=self.verbose,
+                sample_interval=self.sample_interval,
+                mode=self.mode,
+                trace_epoll=self.trace_epoll,
+                valgrind_xml=self.valgrind_xml,
+                origin=self.origin)
+        start_time = time.monotonic()
+        p.run()
+        p.run_time = time.monotonic() - start_time
+        p.cleanup()
+        if self.samples_dir is not None:
+            p.sampler.export(os.path.join(self.samples_dir,
+                '%s.csv' % (cls.__name__)))
+        return p
+
+    def _start_tests(self):
+        # Return, for each group, a list of callables that each yield a
+        # finished test.  With more than one job, every test class (across all
+        # groups) is started right away; each one gets its own ports and
+        # temporary files, so they can run side by side.  Results are still
+        # collected in order, so the output is the same as a sequential run.
+        if self.jobs > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.jobs, thread_name_prefix='test')
+            groups = [[executor.submit(self._run_test, cls).result
+                    for cls in classes]
+                    for classes, pts_for_group in self.test_classes]
+            executor.shutdown(wait=False)
+        else:
+            groups = [[functools.partial(self._run_test, cls)
+                    for cls in classes]
+                    for classes, pts_for_group in self.test_classes]
+        return groups
+
+    def _result(self, group, p, mode_status):
+        result = {
+                'group': group,
+                'test': p.__class__.__name__,
+                'description': p.DESCRIPTION,
+                'attempts': p.attempts,
+                'successes': p.successes,
+                'duration': p.run_time,
+                'requests': p.requests,
+                'resources': p.sampler.summary(),
+                }
+        if self.mem_mgmt is not None:
+            result['mem_mgmt'] = {
+                    'success': bool(p.mem_mgmt),
+                    'leaks': p.leak_summary,
+                    'sites': (p.leaks or [])[:LEAK_SITES],
+                    }
+        if self.clean_shutdown is not None:
+            result['clean_shutdown'] = {
+                    'success': bool(p.mem_cleanup),
+                    'leaks': p.leak_summary,
+                    }
+        if mode_status is not None:
+            model = {
+                    'success': mode_status,
+                    'processes': p.num_processes_realtime,
+                    'threads': p.num_threads_realtime,
+                    }
+            if p.probe is not None:
+                model.update(p.probe.summary())
+            result['concurrency_model'] = model
+        return result
+
+    def run(self):
+        pts = 0
+        possible_pts = 0
+        mem_mgmt = 0
+        possible_mem_mgmt = 0
+        clean_shutdown = 0
+        possible_clean_shutdown = 0
+
+        if self.results is not None:
+            self.results.start({
+                    'mode': self.mode,
+                    'memory_checker': self.mem_check,
+                    'tests': [[cls.__name__ for cls in classes]
+                        for classes, pts_for_group in self.test_classes],
+                    })
+
+        tests = self._start_tests()
+        for num, (classes, pts_for_group) in enumerate(self.test_classes):
+            attempts = 0
+            successes = 0
+            possible_pts += pts_for_group
+            num += 1
+            print('TEST GROUP %d (%d points) ***' % (num, pts_for_group))
+            for cls, get_result in zip(classes, tests[num - 1]):
+                print('    %s' % (cls.DESCRIPTION))
+                print('      %s' % (cls.EXTENDED_DESCRIPTION))
+                sys.stdout.flush()
+
+                p = get_result()
+                attempts += p.attempts
+                successes += p.successes
+                possible_mem_mgmt += 1
+                possible_clean_shutdown += 1
+
+                mem_msg = ''
+                if self.mem_mgmt is not None:
+                    mem_msg += '; Mem Mgmt: '
+                    if p.mem_mgmt:
+                        mem_msg += 'success'
+                        mem_mgmt += 1
+                    else:
+                        mem_msg += 'failure'
+                if self.clean_shutdown is not None:
+                    mem_msg += '; Clean Shutdown: '
+                    if p.mem_cleanup:
+                        mem_msg += 'success'
+                        clean_shutdown += 1
+                    else:
+                        mem_msg += 'failure'
+
+                mode_status = p.check_mode(self.mode)
+                if mode_status is not None:
+                    mem_msg += '; Concurrency model: '
+                    if mode_status:
+                        mem_msg += 'success'
+                    else:
+                        mem_msg += 'failure'
+
+                print('      Result: %d/%d%s' % (p.successes, p.attempts, mem_msg))
+                if self.results is not None:
+                    self.results.test(self._result(num, p, mode_status))
+            tot_pts = pts_for_group * (successes/attempts)
+            pts += tot_pts
+            print('    Subtotal: %d/%d' % (tot_pts, pts_for_group))
+
+        if self.mem_mgmt is not None:
+            possible_pts += self.mem_mgmt
+            mem_mgmt = self.mem_mgmt * (mem_mgmt/possible_mem_mgmt)
+            pts += mem_mgmt
+            print('Mem Mgmt: %d/%d (%s)' % (mem_mgmt, self.mem_mgmt, self.mem_check))
+            
+        if self.clean_shutdown is not None:
+            possible_pts += self.clean_shutdown
+            clean_shutdown = self.clean_shutdown * (clean_shutdown/possible_clean_shutdown)
+            pts += clean_shutdown
+            print('Clean Shutdown: %d/%d (%s)' % (clean_shutdown, self.clean_shutdown, self.mem_check))
+
+        if possible_pts > 0:
+            percent = 100*pts/possible_pts
+        else:
+            percent = 0.0
+
+        print('Total: %d/%d (%.02f%%)' % (pts, possible_pts, percent))
+        if self.results is not None:
+            self.results.finish({
+                    'points': pts,
+                    'possible_points': possible_pts,
+                    'percent': percent,
+                    })
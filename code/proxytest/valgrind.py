@@ -0,0 +1,231 @@
+# proxytest/valgrind.py - Parsing the output of valgrind.
+#
+# The log is parsed as it is written (see ValgrindLogTailer), a chunk at a
+# time, so it never has to be held in memory.  Both the text output (the
+# default) and the XML output (--xml=yes) of memcheck are supported.  Each leak
+# that memcheck reports becomes a LeakRecord, and records are grouped by the
+# site at which the memory was allocated.
+
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+LEAK_CATEGORIES = ('definitely lost', 'indirectly lost', 'possibly lost',
+        'still reachable')
+XML_LEAK_KINDS = {
+        'Leak_DefinitelyLost': 'definitely lost',
+        'Leak_IndirectlyLost': 'indirectly lost',
+        'Leak_PossiblyLost': 'possibly lost',
+        'Leak_StillReachable': 'still reachable',
+        }
+# frames that belong to the allocator rather than to the program
+ALLOCATOR_FUNCTIONS = ('malloc', 'calloc', 'realloc', 'reallocarray',
+        'memalign', 'posix_memalign', 'aligned_alloc', 'strdup', 'strndup',
+        'operator new', 'operator new[]')
+SITE_FRAMES = 3
+TAIL_CHUNK_SIZE = 65536
+
+LOG_PREFIX_RE = re.compile(r'^==\d+==\s?')
+LEAK_RECORD_RE = re.compile(r'^([\d,]+)(?: \(([\d,]+) direct, ([\d,]+) indirect\))? ' + \
+        r'bytes in ([\d,]+) blocks are (%s) in loss record' % \
+        ('|'.join(LEAK_CATEGORIES)))
+LEAK_SUMMARY_RE = re.compile(r'^\s*(%s):\s+([\d,]+) bytes in ([\d,]+) blocks' % \
+        ('|'.join(LEAK_CATEGORIES)))
+FRAME_RE = re.compile(r'^\s+(?:at|by) 0x[0-9A-Fa-f]+: (.*)$')
+
+def _int(s):
+    return int(s.replace(',', ''))
+
+def _key(category):
+    return category.replace(' ', '_')
+
+class LeakRecord:
+    def __init__(self, category, nbytes, blocks, direct_bytes=None):
+        self.category = category
+        self.bytes = nbytes
+        self.blocks = blocks
+        # for definitely lost blocks that point to other (indirectly lost)
+        # blocks, only these bytes count as definitely lost
+        if direct_bytes is None:
+            direct_bytes = nbytes
+        self.direct_bytes = direct_bytes
+        self.frames = []
+
+    @property
+    def site(self):
+        # the innermost frames of the program itself
+        frames = list(self.frames)
+        while frames and frames[0].split(' (')[0] in ALLOCATOR_FUNCTIONS:
+            frames.pop(0)
+        return tuple(frames[:SITE_FRAMES])
+
+    def as_dict(self):
+        return {
+                'category': self.category,
+                'bytes': self.bytes,
+                'blocks': self.blocks,
+                'frames': self.frames,
+                }
+
+class LeakParser:
+    def __init__(self):
+        self.records = []
+        # totals from memcheck's LEAK SUMMARY, if it has one
+        self.leak_summary = {}
+        # memory errors other than leaks
+        self.errors = []
+
+    def feed(self, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @property
+    def summary(self):
+        # bytes lost, per category, as reported by memcheck if possible
+        if self.leak_summary:
+            return dict(self.leak_summary)
+        summary = {}
+        for record in self.records:
+            key = _key(record.category)
+            summary[key] = summary.get(key, 0) + record.direct_bytes
+        return summary
+
+    def by_site(self):
+        # Group the records by category and allocation site.  Return a list of
+        # dictionaries, the largest leaks first.
+        sites = {}
+        for record in self.records:
+            site = sites.setdefault((record.category, record.site), {
+                    'category': record.category,
+                    'site': list(record.site),
+                    'bytes': 0,
+                    'blocks': 0,
+                    'records': 0,
+                    })
+            site['bytes'] += record.direct_bytes
+            site['blocks'] += record.blocks
+            site['records'] += 1
+        return sorted(sites.values(), key=lambda s: s['bytes'], reverse=True)
+
+class TextLeakParser(LeakParser):
+    def __init__(self):
+        super(TextLeakParser, self).__init__()
+        self.partial = ''
+        self.record = None
+
+    def feed(self, data):
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.feed_line(line)
+
+    def close(self):
+        if self.partial:
+            self.feed_line(self.partial)
+            self.partial = ''
+        self.record = None
+
+    def feed_line(self, line):
+        line = LOG_PREFIX_RE.sub('', line.rstrip('\r'))
+        if self.record is not None:
+            m = FRAME_RE.match(line)
+            if m is not None:
+                self.record.frames.append(m.group(1))
+                return
+            self.record = None
+
+        m = LEAK_RECORD_RE.match(line)
+        if m is not None:
+            direct = _int(m.group(2)) if m.group(2) is not None else None
+            self.record = LeakRecord(m.group(5), _int(m.group(1)),
+                    _int(m.group(4)), direct)
+            self.records.append(self.record)
+            return
+
+        m = LEAK_SUMMARY_RE.match(line)
+        if m is not None:
+            self.leak_summary[_key(m.group(1))] = _int(m.group(2))
+
+class XMLLeakParser(LeakParser):
+    def __init__(self):
+        super(XMLLeakParser, self).__init__()
+        self.parser = ET.XMLPullParser(events=('end',))
+
+    def feed(self, data):
+        self.parser.feed(data)
+        self._read_events()
+
+    def close(self):
+        try:
+            self.parser.close()
+        except ET.ParseError:
+            # the log is truncated if the proxy was killed
+            pass
+        self._read_events()
+
+    def _read_events(self):
+        try:
+            for event, elem in self.parser.read_events():
+                if elem.tag == 'error':
+                    self._read_error(elem)
+                    # drop what has been parsed, to keep memory use flat
+                    elem.clear()
+        except ET.ParseError:
+            pass
+
+    def _read_error(self, elem):
+        category = XML_LEAK_KINDS.get(elem.findtext('kind'))
+        if category is None:
+            return
+        nbytes = int(elem.findtext('xwhat/leakedbytes', '0'))
+        blocks = int(elem.findtext('xwhat/leakedblocks', '0'))
+        direct = None
+        m = LEAK_RECORD_RE.match(elem.findtext('xwhat/text', ''))
+        if m is not None and m.group(2) is not None:
+            direct = _int(m.group(2))
+        record = LeakRecord(category, nbytes, blocks, direct)
+        for frame in elem.findall('stack/frame'):
+            fn = frame.findtext('fn', '???')
+            if frame.findtext('file') is not None:
+                record.frames.append('%s (%s:%s)' % \
+                        (fn, frame.findtext('file'), frame.findtext('line')))
+            else:
+                record.frames.append('%s (in %s)' % \
+                        (fn, frame.findtext('obj', '???')))
+        self.records.append(record)
+
+# Feeds a log file to a parser, as it is written, from a background thread.
+class ValgrindLogTailer:
+    def __init__(self, filename, parser, interval=0.1):
+        self.filename = filename
+        self.parser = parser
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        with open(self.filename, 'r', errors='replace') as fh:
+            while True:
+                data = fh.read(TAIL_CHUNK_SIZE)
+                if data:
+                    self.parser.feed(data)
+                elif self.stopped.is_set():
+                    break
+                else:
+                    self.stopped.wait(self.interval)
+        self.parser.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='valgrind-log',
+                daemon=True)
+        self.thread.start()
+
+    def finish(self):
+        # Read the rest of the log (valgrind must have exited) and return the
+        # parser.
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        return self.parser